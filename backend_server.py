@@ -12,23 +12,178 @@ import json
 import time
 import threading
 import math
+import struct
+import hashlib
+import zlib
+import itertools
+import multiprocessing
+import socket
+import sqlite3
+import contextlib
+import uuid
 from io import BytesIO
+from collections import OrderedDict, deque
+from urllib.parse import urlparse, parse_qs
 
 # Import simulators (we'll adapt them for web use)
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Crop-box tracking for hand detection (doesn't import MediaPipe)
+from gesture.hand_roi import HandROI
+
+# Render worker processes (RENDER_WORKERS) are spawned under this name and
+# re-import this module only for the simulators and render_worker_main, so
+# server-only setup with side effects (session store, TTA loader) is skipped there.
+RENDER_WORKER_NAME = 'render-worker'
+IS_RENDER_WORKER = multiprocessing.current_process().name.startswith(RENDER_WORKER_NAME)
 
 # We'll create web-friendly versions of the simulators
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend
+# Enable CORS for frontend (expose frame headers used by binary responses)
+CORS(app, expose_headers=['X-Frame-Timestamp', 'X-Frame-Width', 'X-Frame-Height', 'X-Session-Id',
+                          'X-Session-Affinity', 'X-Encode-Ms', 'X-Frame-Seq', 'Server-Timing', 'ETag'])
 
-# Global state for active simulators
-active_simulators = {}
-simulator_lock = threading.Lock()
 
 # ==================== Simulator Classes (Web-Adapted) ====================
 
+# Static background layers shared across sessions, keyed by geometry parameters
+layer_cache = {}
+layer_cache_lock = threading.Lock()
+LAYER_CACHE_MAX = 64
+
+def cached_layer(key, render):
+    """Return the cached layer for key, rendering it with render() on first use"""
+    layer = layer_cache.get(key)
+    if layer is None:
+        layer = render()
+        if isinstance(layer, np.ndarray):
+            layer.flags.writeable = False  # Shared between sessions; callers copy it
+        with layer_cache_lock:
+            if len(layer_cache) >= LAYER_CACHE_MAX:
+                layer_cache.pop(next(iter(layer_cache)))
+            layer_cache[key] = layer
+    return layer
+
+# Vector text size: FONT_HERSHEY_SIMPLEX at scale 1.0 is roughly a 30px sans-serif font
+VECTOR_FONT_PX = 30
+
+def css_color(bgr):
+    """OpenCV BGR tuple -> '#rrggbb'"""
+    b, g, r = (int(c) for c in bgr)
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+class RasterPainter:
+    """Draws simulator primitives onto a BGR image with OpenCV"""
+    def __init__(self, canvas):
+        self.canvas = canvas
+    
+    def fill(self, color):
+        self.canvas[:] = color
+    
+    def line(self, p1, p2, color, thickness=1, aa=False):
+        cv2.line(self.canvas, p1, p2, color, thickness, cv2.LINE_AA if aa else cv2.LINE_8)
+    
+    def rect(self, p1, p2, color, thickness=1):
+        cv2.rectangle(self.canvas, p1, p2, color, thickness)
+    
+    def circle(self, center, radius, color, thickness=1):
+        cv2.circle(self.canvas, center, radius, color, thickness)
+    
+    def arc(self, center, radius, start_deg, end_deg, color, thickness=1):
+        cv2.ellipse(self.canvas, center, (radius, radius), 0, start_deg, end_deg, color, thickness)
+    
+    def polylines(self, polys, color, thickness=1):
+        cv2.polylines(self.canvas, polys, False, color, thickness)
+    
+    def text(self, text, org, scale, color, thickness=1):
+        cv2.putText(self.canvas, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+
+class VectorPainter:
+    """Records the same primitives as compact JSON-ready ops for client-side drawing.
+
+    ['fill', color]
+    ['line', x1, y1, x2, y2, color, width]
+    ['rect', x1, y1, x2, y2, color, width]
+    ['circle', x, y, r, color, width]
+    ['arc', x, y, r, start_deg, end_deg, color, width]   (clockwise, y down)
+    ['poly', [x0, y0, x1, y1, ...], color, width]       (open polyline)
+    ['text', x, y, text, font_px, color, width]          (x, y = baseline left)
+    Colors are '#rrggbb' and width -1 means filled.
+    """
+    def __init__(self, ops=()):
+        self.ops = list(ops)
+    
+    def fill(self, color):
+        self.ops.append(['fill', css_color(color)])
+    
+    def line(self, p1, p2, color, thickness=1, aa=False):
+        self.ops.append(['line', int(p1[0]), int(p1[1]), int(p2[0]), int(p2[1]), css_color(color), thickness])
+    
+    def rect(self, p1, p2, color, thickness=1):
+        self.ops.append(['rect', int(p1[0]), int(p1[1]), int(p2[0]), int(p2[1]), css_color(color), thickness])
+    
+    def circle(self, center, radius, color, thickness=1):
+        self.ops.append(['circle', int(center[0]), int(center[1]), int(radius), css_color(color), thickness])
+    
+    def arc(self, center, radius, start_deg, end_deg, color, thickness=1):
+        self.ops.append(['arc', int(center[0]), int(center[1]), int(radius), start_deg, end_deg,
+                         css_color(color), thickness])
+    
+    def polylines(self, polys, color, thickness=1):
+        for pts in polys:
+            self.ops.append(['poly', np.asarray(pts).reshape(-1).tolist(), css_color(color), thickness])
+    
+    def text(self, text, org, scale, color, thickness=1):
+        self.ops.append(['text', int(org[0]), int(org[1]), text, round(scale * VECTOR_FONT_PX),
+                         css_color(color), thickness])
+
+def record_ops(draw):
+    """Run a draw(painter) function against a VectorPainter and return its ops as a tuple"""
+    painter = VectorPainter()
+    draw(painter)
+    return tuple(painter.ops)
+
+class TrailBuffer:
+    """Fixed-capacity ring buffer of (x, y) points backed by a NumPy array"""
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.points = np.zeros((self.capacity, 2), dtype=np.float64)
+        self.start = 0  # Index of the oldest point
+        self.size = 0
+    
+    def __len__(self):
+        return self.size
+    
+    def append(self, x, y):
+        """Add a point, overwriting the oldest one when full (O(1))"""
+        idx = (self.start + self.size) % self.capacity
+        self.points[idx, 0] = x
+        self.points[idx, 1] = y
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+    
+    def clear(self):
+        self.start = 0
+        self.size = 0
+    
+    def ordered(self):
+        """Points from oldest to newest as an (n, 2) array"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.points[self.start:end]
+        return np.concatenate((self.points[self.start:], self.points[:end - self.capacity]))
+    
+    def to_pixels(self, origin, pixels_per_meter):
+        """Map metre points to int32 pixel points (y up) in one vectorized step"""
+        pts = self.ordered()
+        px = np.empty((len(pts), 2), dtype=np.int32)
+        px[:, 0] = origin[0] + pts[:, 0] * pixels_per_meter
+        px[:, 1] = origin[1] - pts[:, 1] * pixels_per_meter
+        return px
+
 class WebProjectileSimulator:
     """Web-friendly projectile motion simulator"""
     def __init__(self):
@@ -40,85 +195,172 @@ class WebProjectileSimulator:
         self.gravity = 9.81
         self.pixels_per_meter = 12.0
         self.origin_px = (60, self.height - 60)
-        self.projectiles = []
-        self.trajectory = []
-        self.last_update = time.time()
-        self.max_dt = 0.05
+        self.path_samples = 240  # Samples per precomputed path
+        self.y_floor = -5.0      # Projectiles are removed below this height (m)
+        self.x_limit = 2000.0    # ...or beyond this distance (m)
         self.x_meters_visible = 20.0
         self.y_meters_visible = 10.0
+        self.reset()
+    
+    def reset(self):
+        """Return to the initial state (no projectiles)"""
+        self.projectiles = []    # In flight, each with a precomputed closed-form path
+        self.trajectory = None   # Path of the most recent launch
         
     def launch(self, velocity, angle_deg):
-        import math
         angle_rad = math.radians(angle_deg)
         vx = float(velocity) * math.cos(angle_rad)
         vy = float(velocity) * math.sin(angle_rad)
+        t_end = self.flight_time(vx, vy)
+        
+        # Sample the whole path once: x = vx*t, y = vy*t - g*t^2/2
+        ts = np.linspace(0.0, t_end, self.path_samples)
+        xs = vx * ts
+        ys = vy * ts - 0.5 * self.gravity * ts * ts
         self.projectiles.append({
-            'x': 0.0, 'y': 0.0, 'vx': vx, 'vy': vy, 't': time.time()
+            'vx': vx, 'vy': vy, 't0': time.time(), 't_end': t_end,
+            'ts': ts, 'path_px': self.to_pixels(xs, ys)
         })
-        self.trajectory = []
-        
-    def update(self):
-        now = time.time()
-        dt = min(self.max_dt, now - self.last_update)
-        self.last_update = now
-        
-        alive = []
-        for p in self.projectiles:
-            p['x'] += p['vx'] * dt
-            p['y'] += p['vy'] * dt
-            p['vy'] -= self.gravity * dt
-            self.trajectory.append((p['x'], p['y']))
-            if p['y'] >= -5.0 and p['x'] < 2000.0:
-                alive.append(p)
-        self.projectiles = alive
-        
-        # Render canvas
+        self.trajectory = self.projectiles[-1]
+    
+    def flight_time(self, vx, vy):
+        """Time until the projectile drops below y_floor or passes x_limit"""
+        g = self.gravity
+        t_end = (vy + math.sqrt(vy * vy - 2.0 * g * self.y_floor)) / g
+        if vx > 0:
+            t_end = min(t_end, self.x_limit / vx)
+        return t_end
+    
+    def position(self, p, t):
+        """Closed-form position (m) of projectile p at t seconds after launch"""
+        return p['vx'] * t, p['vy'] * t - 0.5 * self.gravity * t * t
+    
+    def position_px(self, p, t):
+        """Pixel point of projectile p at t seconds after launch"""
+        x, y = self.position(p, t)
+        return self.to_pixels([x], [y])[0]
+    
+    def to_pixels(self, xs, ys):
+        """Map metre coordinates to int32 pixel points, clamped to canvas bounds"""
+        px = np.empty((len(xs), 2), dtype=np.int32)
+        px[:, 0] = np.clip(self.origin_px[0] + np.asarray(xs) * self.pixels_per_meter, 0, self.width - 1)
+        px[:, 1] = np.clip(self.origin_px[1] - np.asarray(ys) * self.pixels_per_meter, 0, self.height - 1)
+        return px
+    
+    def state_key(self):
+        """Frame only changes while projectiles are in flight; None means always render"""
+        if self.projectiles:
+            return None
+        return (self.width, self.height, self.trajectory['t0'] if self.trajectory else None)
+    
+    def background_key(self):
+        return ('projectile', self.width, self.height, self.pixels_per_meter, self.origin_px,
+                self.x_meters_visible, self.y_meters_visible)
+    
+    def background(self):
+        """Static grid and axes layer, rendered once per geometry"""
+        return cached_layer(self.background_key(), self.render_background)
+    
+    def background_ops(self):
+        """Static grid and axes as vector ops, recorded once per geometry"""
+        return cached_layer(self.background_key() + ('vector',),
+                            lambda: record_ops(self.draw_background))
+    
+    def render_background(self):
         canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        canvas[:] = (10, 10, 30)
+        self.draw_background(RasterPainter(canvas))
+        return canvas
+    
+    def draw_background(self, p):
+        """Draw grid and axes"""
+        p.fill((10, 10, 30))
         
         # Draw grid
         for m in range(0, int(self.x_meters_visible)+1):
             x_px = int(self.origin_px[0] + m * self.pixels_per_meter)
-            cv2.line(canvas, (x_px, 0), (x_px, self.height), (40, 40, 60), 1)
+            p.line((x_px, 0), (x_px, self.height), (40, 40, 60), 1)
         for m in range(0, int(self.y_meters_visible)+1):
             y_px = int(self.origin_px[1] - m * self.pixels_per_meter)
-            cv2.line(canvas, (0, y_px), (self.width, y_px), (40, 40, 60), 1)
+            p.line((0, y_px), (self.width, y_px), (40, 40, 60), 1)
             
         # Draw axes
         x_end = int(self.origin_px[0] + self.x_meters_visible * self.pixels_per_meter)
-        cv2.line(canvas, (self.origin_px[0], self.origin_px[1]), 
+        p.line((self.origin_px[0], self.origin_px[1]), 
                  (x_end, self.origin_px[1]), (200, 200, 200), 2)
         y_top = int(self.origin_px[1] - self.y_meters_visible * self.pixels_per_meter)
-        cv2.line(canvas, (self.origin_px[0], self.origin_px[1]), 
+        p.line((self.origin_px[0], self.origin_px[1]), 
                  (self.origin_px[0], y_top), (200, 200, 200), 2)
-        
-        # Draw trajectory with visible color (clamp to canvas bounds)
-        if len(self.trajectory) >= 2:
-            for i in range(1, len(self.trajectory)):
-                x1 = int(self.origin_px[0] + self.trajectory[i-1][0] * self.pixels_per_meter)
-                y1 = int(self.origin_px[1] - self.trajectory[i-1][1] * self.pixels_per_meter)
-                x2 = int(self.origin_px[0] + self.trajectory[i][0] * self.pixels_per_meter)
-                y2 = int(self.origin_px[1] - self.trajectory[i][1] * self.pixels_per_meter)
-                # Clamp coordinates to canvas bounds
-                x1 = max(0, min(self.width - 1, x1))
-                y1 = max(0, min(self.height - 1, y1))
-                x2 = max(0, min(self.width - 1, x2))
-                y2 = max(0, min(self.height - 1, y2))
+    
+    def update(self):
+        # Render canvas on top of the cached grid/axes layer
+        canvas = self.background().copy()
+        self.draw(RasterPainter(canvas))
+        return canvas
+    
+    def scene(self):
+        """Current frame as vector ops (see VectorPainter)"""
+        painter = VectorPainter(self.background_ops())
+        self.draw(painter)
+        return painter.ops
+    
+    def draw(self, p):
+        """Advance to the current time and draw trajectory and projectiles"""
+        now = time.time()
+        self.projectiles = [proj for proj in self.projectiles if now - proj['t0'] < proj['t_end']]
+        
+        # Draw trajectory up to the current time with visible color
+        traj = self.trajectory
+        if traj is not None:
+            elapsed = min(now - traj['t0'], traj['t_end'])
+            n = int(np.searchsorted(traj['ts'], elapsed, side='right'))
+            pts = traj['path_px'][:n]
+            if elapsed < traj['t_end']:
+                pts = np.vstack([pts, self.position_px(traj, elapsed)])
+            if len(pts) >= 2:
                 # Use bright yellow/orange color for trajectory
-                cv2.line(canvas, (x1, y1), (x2, y2), (0, 200, 255), 2)
+                p.polylines([pts], (0, 200, 255), 2)
         
         # Draw projectiles (clamp to canvas bounds)
-        for p in self.projectiles:
-            x_px = int(self.origin_px[0] + p['x'] * self.pixels_per_meter)
-            y_px = int(self.origin_px[1] - p['y'] * self.pixels_per_meter)
-            x_px = max(0, min(self.width - 1, x_px))
-            y_px = max(0, min(self.height - 1, y_px))
-            cv2.circle(canvas, (x_px, y_px), 6, (0, 180, 255), -1)
+        for proj in self.projectiles:
+            x_px, y_px = self.position_px(proj, now - proj['t0'])
+            p.circle((int(x_px), int(y_px)), 6, (0, 180, 255), -1)
         
         # Origin marker
-        cv2.circle(canvas, self.origin_px, 4, (220, 220, 220), -1)
-        
-        return canvas
+        p.circle(self.origin_px, 4, (220, 220, 220), -1)
+
+# Gravity presets (m/s^2), as in othermain/hello.py's ProjectileEngine
+GRAVITY_MODES = {'Earth': 9.8, 'Moon': 1.6, 'Mars': 3.7}
+BATCH_MAX_LAUNCHES = 50000
+BATCH_MAX_PATH_POINTS = 2000000  # launches * samples
+
+def projectile_batch(v, angle_deg, g, height=0.0, samples=0):
+    """Closed-form results for many launches at once.
+
+    v, angle_deg, g are equal-length arrays (one entry per launch), launched
+    from height metres above flat ground. Returns a dict of per-launch arrays:
+    flight_time, range, apex_height, apex_time and, if samples > 0, x/y paths
+    shaped (launches, samples) from launch to landing.
+    """
+    v = np.asarray(v, dtype=np.float64)
+    g = np.asarray(g, dtype=np.float64)
+    angle = np.radians(np.asarray(angle_deg, dtype=np.float64))
+    vx = v * np.cos(angle)
+    vy = v * np.sin(angle)
+    
+    # Landing: height + vy*t - g*t^2/2 = 0
+    flight_time = (vy + np.sqrt(vy * vy + 2.0 * g * height)) / g
+    up = np.maximum(vy, 0.0)
+    result = {
+        'flight_time': flight_time,
+        'range': vx * flight_time,
+        'apex_time': up / g,
+        'apex_height': height + up * up / (2.0 * g),
+    }
+    if samples > 0:
+        ts = flight_time[:, None] * np.linspace(0.0, 1.0, samples)
+        result['x'] = vx[:, None] * ts
+        result['y'] = height + vy[:, None] * ts - 0.5 * g[:, None] * ts * ts
+    return result
 
 class WebOpticsSimulator:
     """Web-friendly optics simulator"""
@@ -126,6 +368,10 @@ class WebOpticsSimulator:
         self.width = 800
         self.height = 480
         self.axis_y = self.height // 2
+        self.reset()
+    
+    def reset(self):
+        """Restore the default object, lens and display settings"""
         self.lens_x = self.width * 3 // 5
         self.obj_x = self.width // 5
         self.obj_h = min(80, self.height // 6)  # Scale object height to fit
@@ -133,32 +379,44 @@ class WebOpticsSimulator:
         self.mode = 0  # 0 = lens, 1 = mirror
         self.show_rays = True
         
+    def state_key(self):
+        """Parameters the rendered frame depends on"""
+        return (self.width, self.height, self.obj_x, self.obj_h, self.lens_x,
+                self.focal, self.mode, self.show_rays)
+    
     def update(self):
-        import math
         canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        canvas[:] = (12, 18, 28)
+        self.draw(RasterPainter(canvas))
+        return canvas
+    
+    def scene(self):
+        """Current frame as vector ops (see VectorPainter)"""
+        return record_ops(self.draw)
+    
+    def draw(self, p):
+        import math
+        p.fill((12, 18, 28))
         
         # Optical axis
-        cv2.line(canvas, (0, self.axis_y), (self.width, self.axis_y), (180, 180, 180), 1)
+        p.line((0, self.axis_y), (self.width, self.axis_y), (180, 180, 180), 1)
         
         # Scale lens/mirror to fit canvas
         lens_height = min(180, self.height // 3)
         
         # Draw lens or mirror (scaled to fit)
         if self.mode == 0:
-            cv2.rectangle(canvas, (self.lens_x - 8, self.axis_y - lens_height), 
+            p.rect((self.lens_x - 8, self.axis_y - lens_height), 
                          (self.lens_x + 8, self.axis_y + lens_height), (180, 220, 255), -1)
-            cv2.rectangle(canvas, (self.lens_x - 8, self.axis_y - lens_height), 
+            p.rect((self.lens_x - 8, self.axis_y - lens_height), 
                          (self.lens_x + 8, self.axis_y + lens_height), (90, 140, 180), 2)
         else:
-            cv2.ellipse(canvas, (self.lens_x, self.axis_y), (lens_height, lens_height), 0, -90, 90, 
-                       (180, 220, 255), 3)
+            p.arc((self.lens_x, self.axis_y), lens_height, -90, 90, (180, 220, 255), 3)
         
         # Draw object
         obj_top = (self.obj_x, self.axis_y - self.obj_h)
         obj_bottom = (self.obj_x, self.axis_y)
-        cv2.line(canvas, obj_bottom, obj_top, (255, 200, 80), 3)
-        cv2.rectangle(canvas, (self.obj_x - 6, self.axis_y - self.obj_h - 12), 
+        p.line(obj_bottom, obj_top, (255, 200, 80), 3)
+        p.rect((self.obj_x - 6, self.axis_y - self.obj_h - 12), 
                      (self.obj_x + 6, self.axis_y - self.obj_h), (255, 200, 80), -1)
         
         # Calculate image
@@ -182,15 +440,15 @@ class WebOpticsSimulator:
             img_top = (image_x, self.axis_y - img_h)
             img_bottom = (image_x, self.axis_y)
             color = (255, 230, 120) if v > 0 else (120, 235, 255)
-            cv2.line(canvas, img_bottom, img_top, color, 2)
-            cv2.rectangle(canvas, (image_x - 6, self.axis_y - img_h - 10), 
+            p.line(img_bottom, img_top, color, 2)
+            p.rect((image_x - 6, self.axis_y - img_h - 10), 
                          (image_x + 6, self.axis_y - img_h), color, -1)
         
         # Focal points
         fpx = int(self.lens_x + self.focal)
         fnx = int(self.lens_x - self.focal)
-        cv2.circle(canvas, (fpx, self.axis_y), 4, (120, 255, 200), -1)
-        cv2.circle(canvas, (fnx, self.axis_y), 4, (255, 120, 200), -1)
+        p.circle((fpx, self.axis_y), 4, (120, 255, 200), -1)
+        p.circle((fnx, self.axis_y), 4, (255, 120, 200), -1)
         
         # Draw principal rays if enabled
         if self.show_rays:
@@ -206,13 +464,13 @@ class WebOpticsSimulator:
             # Ray 1: Parallel to axis from top of object -> through focal after lens
             p0 = (self.obj_x, int(y0))
             p1 = (self.lens_x, int(y0))
-            cv2.line(canvas, p0, p1, (255, 255, 255), 1, cv2.LINE_AA)
+            p.line(p0, p1, (255, 255, 255), 1, aa=True)
             
             if self.mode == 0:  # Lens
                 # Refracted: through focal point on other side
                 if image_x is not None and np.isfinite(v):
                     p2 = (int(image_x), int(self.axis_y - img_h))
-                    cv2.line(canvas, p1, p2, (255, 255, 255), 1, cv2.LINE_AA)
+                    p.line(p1, p2, (255, 255, 255), 1, aa=True)
                 else:
                     # Go toward focal point
                     p_f = (int(self.lens_x + self.focal), self.axis_y)
@@ -220,27 +478,42 @@ class WebOpticsSimulator:
                     if self.focal != 0:
                         t = dx
                         p_far = (int(self.lens_x + t), int(y0 + (self.axis_y - p_f[1]) * (t / max(1, abs(self.focal)))))
-                        cv2.line(canvas, p1, p_far, (255, 255, 255), 1, cv2.LINE_AA)
+                        p.line(p1, p_far, (255, 255, 255), 1, aa=True)
             else:  # Mirror
                 # Reflect direction
                 dx = -800 if self.focal > 0 else 800
                 p_far = (int(self.lens_x + dx), int(y0))
-                cv2.line(canvas, p1, p_far, (255, 255, 255), 1, cv2.LINE_AA)
+                p.line(p1, p_far, (255, 255, 255), 1, aa=True)
             
             # Ray 2: Through center of lens (undeviated)
             center = (self.lens_x, self.axis_y)
             if abs(self.lens_x - self.obj_x) > 1:
                 p_end_x = center[0] + 300
                 p_end_y = int(y0 + (center[1] - y0) * (300 / abs(self.lens_x - self.obj_x)))
-                cv2.line(canvas, (self.obj_x, int(y0)), (p_end_x, p_end_y), (200, 200, 255), 1, cv2.LINE_AA)
+                p.line((self.obj_x, int(y0)), (p_end_x, p_end_y), (200, 200, 255), 1, aa=True)
             
             # Ray 3: Through focal point (object side) -> emerges parallel
             focal_obj_side = (self.lens_x - self.focal, self.axis_y)
-            cv2.line(canvas, (self.obj_x, int(y0)), (int(focal_obj_side[0]), int(focal_obj_side[1])), (200, 255, 200), 1, cv2.LINE_AA)
+            p.line((self.obj_x, int(y0)), (int(focal_obj_side[0]), int(focal_obj_side[1])), (200, 255, 200), 1, aa=True)
             if self.mode == 0:  # Lens
-                cv2.line(canvas, (int(focal_obj_side[0]), int(focal_obj_side[1])), (self.lens_x + 400, int(y0)), (200, 255, 200), 1, cv2.LINE_AA)
-        
-        return canvas
+                p.line((int(focal_obj_side[0]), int(focal_obj_side[1])), (self.lens_x + 400, int(y0)), (200, 255, 200), 1, aa=True)
+
+# Wave field quality modes: compute on a grid downsampled by this factor, then upsample
+WAVE_QUALITY_SCALES = {'high': 1, 'medium': 2, 'low': 4}
+
+# Read-only pixel coordinate axes shared by all wave sessions, keyed by (width, height)
+coord_axes_cache = {}
+
+def coord_axes(width, height):
+    """Shared float32 axes shaped (1, width) and (height, 1) that broadcast to the full grid"""
+    axes = coord_axes_cache.get((width, height))
+    if axes is None:
+        xs = np.arange(width, dtype=np.float32).reshape(1, width)
+        ys = np.arange(height, dtype=np.float32).reshape(height, 1)
+        xs.flags.writeable = False
+        ys.flags.writeable = False
+        axes = coord_axes_cache.setdefault((width, height), (xs, ys))
+    return axes
 
 class WebWaveSimulator:
     """Web-friendly wave interference simulator"""
@@ -249,40 +522,91 @@ class WebWaveSimulator:
         self.height = 480
         self.c = 1.0
         self.decay = 0.08
+        self.grid_x, self.grid_y = coord_axes(self.width, self.height)
+        self.distance_maps = {}  # source index -> ((x, y, decay, scale), r, attenuation)
+        self.field = None
+        self.work = None
+        self.reset()
+    
+    def reset(self):
+        """Restore default sources and time; keeps distance maps and frame buffers for reuse"""
         self.sources = [
             {'pos': np.array([self.width*0.33, self.height*0.5]), 'amp': 0.9, 'freq': 1.2, 'phase': 0.0},
             {'pos': np.array([self.width*0.66, self.height*0.5]), 'amp': 0.9, 'freq': 1.2, 'phase': 0.0},
         ]
         self.two_source = True
-        self.grid_x, self.grid_y = np.meshgrid(np.arange(self.width), np.arange(self.height))
+        self.quality_mode = 'high'
         self.t = 0.0
         self.paused = False
         
+    def state_key(self):
+        """Frame is static only while paused; None means always render"""
+        if not self.paused:
+            return None
+        return (self.width, self.height, self.t, self.two_source, self.quality_mode,
+                tuple((tuple(s['pos']), s['amp'], s['freq']) for s in self.sources))
+    
+    def scale(self):
+        """Downsampling factor for the current quality mode"""
+        return WAVE_QUALITY_SCALES.get(self.quality_mode, 1)
+    
+    def source_maps(self, idx, scale):
+        """Cached float32 (radius, attenuation) maps for a source, recomputed only when it moves"""
+        s = self.sources[idx]
+        key = (float(s['pos'][0]), float(s['pos'][1]), self.decay, scale)
+        cached = self.distance_maps.get(idx)
+        if cached is None or cached[0] != key:
+            sx, sy = key[0], key[1]
+            # Sample every scale-th pixel, offset toward the block centre
+            o = (scale - 1) // 2
+            rx = self.grid_x[:, o::scale] - np.float32(sx)
+            ry = self.grid_y[o::scale, :] - np.float32(sy)
+            r = np.hypot(rx, ry)  # Broadcasts (1, w) x (h, 1) to (h, w)
+            r += np.float32(1e-6)
+            att = r * np.float32(self.decay)
+            att += np.float32(1.0)
+            np.reciprocal(att, out=att)
+            cached = (key, r, att)
+            self.distance_maps[idx] = cached
+        return cached[1], cached[2]
+    
     def update(self, dt=0.033):
-        import math
         if not self.paused:
             self.t += dt
         
-        field = np.zeros((self.height, self.width), dtype=np.float32)
-        active = [self.sources[0]]
-        if self.two_source:
-            active.append(self.sources[1])
-            
-        for s in active:
-            sx, sy = s['pos']
-            rx = (self.grid_x - sx).astype(np.float32)
-            ry = (self.grid_y - sy).astype(np.float32)
-            r = np.hypot(rx, ry) + 1e-6
+        scale = self.scale()
+        active = [0, 1] if self.two_source else [0]
+        maps = [self.source_maps(idx, scale) for idx in active]
+        
+        # (Re)allocate frame buffers when the sampling grid changes
+        shape = maps[0][0].shape
+        if self.field is None or self.field.shape != shape:
+            self.field = np.zeros(shape, dtype=np.float32)
+            self.work = np.empty(shape, dtype=np.float32)
+        field = self.field
+        work = self.work
+        field.fill(0.0)
+        
+        # amp * att * sin(omega*t - (omega/c)*r), one sine pass per source
+        for idx, (r, att) in zip(active, maps):
+            s = self.sources[idx]
             omega = 2.0 * math.pi * float(s['freq'])
-            arg = omega * (self.t - (r / self.c))
-            att = 1.0 / (1.0 + r * self.decay)
-            contrib = float(s['amp']) * att * np.sin(arg)
-            field += contrib.astype(np.float32)
+            phase = math.fmod(omega * self.t, 2.0 * math.pi)  # Keep float32 sin argument small
+            np.multiply(r, np.float32(-omega / self.c), out=work)
+            work += np.float32(phase)
+            np.sin(work, out=work)
+            work *= att
+            work *= np.float32(s['amp'])
+            field += work
         
         # Render to color map
-        vmax = max(0.5, np.max(np.abs(field)))
-        img_norm = (field / vmax) * 127.0 + 128.0
-        img_u8 = np.clip(img_norm, 0, 255).astype(np.uint8)
+        vmax = max(0.5, float(field.max()), float(-field.min()))
+        np.multiply(field, np.float32(127.0 / vmax), out=work)
+        work += np.float32(128.0)
+        np.clip(work, 0, 255, out=work)
+        img_u8 = work.astype(np.uint8)
+        if scale > 1:
+            img_u8 = cv2.resize(img_u8, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
         canvas = cv2.applyColorMap(img_u8, cv2.COLORMAP_TURBO)
         
         # Draw sources
@@ -298,14 +622,29 @@ class WebRotationalSimulator:
         self.width = 800
         self.height = 480
         self.center = (self.width // 2, self.height // 2)
-        self.radius_m = 1.0
         self.pixels_per_meter = 80.0
+        self.trail = TrailBuffer(400)
+        self.reset()
+    
+    def reset(self):
+        """Restore default radius and speed and clear the trail"""
+        self.radius_m = 1.0
         self.omega = 2.0
         self.theta = 0.0
-        self.trail = []
+        self.trail.clear()
         self.last_update = time.time()
         
     def update(self):
+        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.draw(RasterPainter(canvas))
+        return canvas
+    
+    def scene(self):
+        """Current frame as vector ops (see VectorPainter)"""
+        return record_ops(self.draw)
+    
+    def draw(self, p):
+        """Advance the rotation and draw circle, trail and current position"""
         import math
         now = time.time()
         dt = min(0.05, now - self.last_update)
@@ -314,38 +653,37 @@ class WebRotationalSimulator:
         self.theta += self.omega * dt
         x = self.radius_m * math.cos(self.theta)
         y = self.radius_m * math.sin(self.theta)
-        self.trail.append((x, y))
-        if len(self.trail) > 400:
-            self.trail.pop(0)
+        self.trail.append(x, y)
         
-        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        canvas[:] = (20, 20, 20)
+        p.fill((20, 20, 20))
         
         r_px = int(round(self.radius_m * self.pixels_per_meter))
-        cv2.circle(canvas, self.center, abs(r_px), (70, 70, 70), 2)
-        cv2.line(canvas, (0, self.center[1]), (self.width, self.center[1]), (100, 100, 100), 1)
-        cv2.line(canvas, (self.center[0], 0), (self.center[0], self.height), (100, 100, 100), 1)
+        p.circle(self.center, abs(r_px), (70, 70, 70), 2)
+        p.line((0, self.center[1]), (self.width, self.center[1]), (100, 100, 100), 1)
+        p.line((self.center[0], 0), (self.center[0], self.height), (100, 100, 100), 1)
         
         # Draw trail
         if len(self.trail) >= 2:
-            pts = [(int(self.center[0] + xx * self.pixels_per_meter), 
-                   int(self.center[1] - yy * self.pixels_per_meter)) 
-                  for (xx, yy) in self.trail]
-            for i in range(1, len(pts)):
-                cv2.line(canvas, pts[i-1], pts[i], (200, 200, 200), 1)
+            pts = self.trail.to_pixels(self.center, self.pixels_per_meter)
+            p.polylines([pts], (200, 200, 200), 1)
         
         # Draw current position
         px = (int(self.center[0] + x * self.pixels_per_meter), 
               int(self.center[1] - y * self.pixels_per_meter))
-        cv2.circle(canvas, px, 8, (0, 180, 255), -1)
-        
-        return canvas
+        p.circle(px, 8, (0, 180, 255), -1)
 
 class WebTrigSimulator:
     """Web-friendly trigonometric graph visualizer"""
     def __init__(self):
         self.width = 800
         self.height = 480
+        self.curve_color = (0, 140, 255)  # Math accent color (blue)
+        self.curve_samples = 2000
+        self.curve_cache = None  # ((func, x_left, x_right, y_clip, ...), pixel segments)
+        self.reset()
+    
+    def reset(self):
+        """Restore the default function, angle and view range"""
         self.func = 'sin'
         self.angle_deg = 30.0
         self.x_left = -360
@@ -376,23 +714,40 @@ class WebTrigSimulator:
         mask = np.isfinite(y) & (np.abs(y) < 1e6)
         return y, mask
     
-    def update(self):
-        import math
-        import numpy as np
-        
-        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        canvas[:] = (13, 13, 13)  # Dark background
-        
-        # Calculate graph area (with margins)
+    def state_key(self):
+        """Parameters the rendered frame depends on"""
+        return (self.width, self.height, self.func, self.angle_deg, self.x_left,
+                self.x_right, self.y_clip, self.show_grid)
+    
+    def graph_rect(self):
+        """Graph area (with margins) as (x, y, w, h)"""
         margin = 60
-        graph_x = margin
-        graph_y = margin
-        graph_w = self.width - 2 * margin
-        graph_h = self.height - 2 * margin
+        return margin, margin, self.width - 2 * margin, self.height - 2 * margin
+    
+    def deg_to_x(self, deg):
+        """Map degrees to pixel x coordinate"""
+        graph_x, _, graph_w, _ = self.graph_rect()
+        t = (deg - self.x_left) / (self.x_right - self.x_left) if (self.x_right - self.x_left) != 0 else 0
+        return int(graph_x + t * graph_w)
+    
+    def y_to_pixel(self, y_val):
+        """Map y value to pixel y coordinate"""
+        _, graph_y, _, graph_h = self.graph_rect()
+        t = (y_val + self.y_clip) / (2 * self.y_clip) if self.y_clip > 0 else 0.5
+        t = max(0, min(1, t))
+        return int(graph_y + (1 - t) * graph_h)
+    
+    def curve_points(self):
+        """Continuous curve segments as int32 pixel polylines, cached on the graph parameters"""
+        key = (self.func, self.x_left, self.x_right, self.y_clip, self.width, self.height)
+        if self.curve_cache is not None and self.curve_cache[0] == key:
+            return self.curve_cache[1]
+        
+        graph_x, graph_y, graph_w, graph_h = self.graph_rect()
         
         # Build x axis in degrees and radians
-        x_degs = np.linspace(self.x_left, self.x_right, 2000)
-        x_rads = np.array([self.deg2rad(d) for d in x_degs])
+        x_degs = np.linspace(self.x_left, self.x_right, self.curve_samples)
+        x_rads = x_degs * math.pi / 180.0
         
         # Compute y values
         y_vals, valid_mask = self.compute_trig(self.func, x_rads)
@@ -403,16 +758,52 @@ class WebTrigSimulator:
         big_jump = diff > (self.y_clip * 0.5)
         break_mask = (~valid_mask) | big_jump
         
-        # Map degrees to pixel x coordinates
-        def deg_to_x(deg):
-            t = (deg - self.x_left) / (self.x_right - self.x_left) if (self.x_right - self.x_left) != 0 else 0
-            return int(graph_x + t * graph_w)
+        # Each break starts a new segment; points outside the clip range are skipped
+        seg_id = np.cumsum(break_mask)
+        with np.errstate(invalid='ignore'):
+            keep = ~break_mask & (np.abs(y_vals) <= self.y_clip)
+        
+        # Map to pixel coordinates
+        span = self.x_right - self.x_left
+        tx = (x_degs[keep] - self.x_left) / span if span != 0 else np.zeros(int(keep.sum()))
+        if self.y_clip > 0:
+            ty = np.clip((y_vals[keep] + self.y_clip) / (2 * self.y_clip), 0, 1)
+        else:
+            ty = np.full(int(keep.sum()), 0.5)
+        pts = np.empty((len(tx), 2), dtype=np.int32)
+        pts[:, 0] = graph_x + tx * graph_w
+        pts[:, 1] = graph_y + (1 - ty) * graph_h
+        
+        splits = np.flatnonzero(np.diff(seg_id[keep])) + 1
+        segments = [seg for seg in np.split(pts, splits) if len(seg) >= 2]
+        self.curve_cache = (key, segments)
+        return segments
+    
+    def background_key(self):
+        return ('trig', self.width, self.height, self.func, self.x_left, self.x_right,
+                self.y_clip, self.show_grid)
+    
+    def background(self):
+        """Static layer (grid, axes, curve, asymptotes, labels), rendered once per graph"""
+        return cached_layer(self.background_key(), self.render_background)
+    
+    def background_ops(self):
+        """Static layer as vector ops, recorded once per graph"""
+        return cached_layer(self.background_key() + ('vector',),
+                            lambda: record_ops(self.draw_background))
+    
+    def render_background(self):
+        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.draw_background(RasterPainter(canvas))
+        return canvas
+    
+    def draw_background(self, p):
+        """Draw everything that doesn't depend on angle_deg"""
+        p.fill((13, 13, 13))  # Dark background
         
-        # Map y value to pixel y coordinates
-        def y_to_pixel(y_val):
-            t = (y_val + self.y_clip) / (2 * self.y_clip) if self.y_clip > 0 else 0.5
-            t = max(0, min(1, t))
-            return int(graph_y + (1 - t) * graph_h)
+        graph_x, graph_y, graph_w, graph_h = self.graph_rect()
+        deg_to_x = self.deg_to_x
+        y_to_pixel = self.y_to_pixel
         
         # Draw grid if enabled
         if self.show_grid:
@@ -421,80 +812,25 @@ class WebTrigSimulator:
                 if abs(y_val) < 0.1:
                     continue  # Skip zero line (will draw axis)
                 y_px = y_to_pixel(y_val)
-                cv2.line(canvas, (graph_x, y_px), (graph_x + graph_w, y_px), (40, 40, 60), 1)
+                p.line((graph_x, y_px), (graph_x + graph_w, y_px), (40, 40, 60), 1)
             
             # Vertical grid lines (x values)
             step = max(30, (self.x_right - self.x_left) // 20)
             for x_deg in range(int(self.x_left), int(self.x_right) + 1, step):
                 x_px = deg_to_x(x_deg)
-                cv2.line(canvas, (x_px, graph_y), (x_px, graph_y + graph_h), (40, 40, 60), 1)
+                p.line((x_px, graph_y), (x_px, graph_y + graph_h), (40, 40, 60), 1)
         
         # Draw axes
         zero_y_px = y_to_pixel(0)
-        cv2.line(canvas, (graph_x, zero_y_px), (graph_x + graph_w, zero_y_px), (200, 200, 200), 2)
+        p.line((graph_x, zero_y_px), (graph_x + graph_w, zero_y_px), (200, 200, 200), 2)
         
         zero_x_deg = 0
         if self.x_left <= zero_x_deg <= self.x_right:
             zero_x_px = deg_to_x(zero_x_deg)
-            cv2.line(canvas, (zero_x_px, graph_y), (zero_x_px, graph_y + graph_h), (200, 200, 200), 2)
-        
-        # Draw function curve (split at discontinuities)
-        segments_x = []
-        segments_y = []
-        current_x = []
-        current_y = []
-        
-        for xi, yi, br in zip(x_degs, y_vals, break_mask):
-            if br:
-                if current_x:
-                    segments_x.append(np.array(current_x))
-                    segments_y.append(np.array(current_y))
-                    current_x = []
-                    current_y = []
-            else:
-                if abs(yi) <= self.y_clip:  # Only draw if within clip range
-                    current_x.append(xi)
-                    current_y.append(yi)
-        
-        if current_x:
-            segments_x.append(np.array(current_x))
-            segments_y.append(np.array(current_y))
-        
-        # Draw each continuous segment
-        color = (0, 140, 255)  # Math accent color (blue)
-        for sx, sy in zip(segments_x, segments_y):
-            if len(sx) < 2:
-                continue
-            points = []
-            for x_deg, y_val in zip(sx, sy):
-                x_px = deg_to_x(x_deg)
-                y_px = y_to_pixel(y_val)
-                points.append((x_px, y_px))
-            
-            # Draw as connected lines
-            for i in range(1, len(points)):
-                if 0 <= points[i-1][0] < self.width and 0 <= points[i-1][1] < self.height and \
-                   0 <= points[i][0] < self.width and 0 <= points[i][1] < self.height:
-                    cv2.line(canvas, points[i-1], points[i], color, 2)
+            p.line((zero_x_px, graph_y), (zero_x_px, graph_y + graph_h), (200, 200, 200), 2)
         
-        # Draw vertical marker at selected angle
-        x_sel = float(self.angle_deg)
-        if self.x_left <= x_sel <= self.x_right:
-            x_sel_px = deg_to_x(x_sel)
-            cv2.line(canvas, (x_sel_px, graph_y), (x_sel_px, graph_y + graph_h), (0, 255, 0), 1, cv2.LINE_AA)
-            
-            # Draw point marker
-            y_sel, ok = self.compute_trig(self.func, np.array([self.deg2rad(x_sel)]))
-            y_point = y_sel[0] if ok[0] and np.isfinite(y_sel[0]) and abs(y_sel[0]) <= self.y_clip else None
-            
-            if y_point is not None:
-                y_sel_px = y_to_pixel(y_point)
-                cv2.circle(canvas, (x_sel_px, y_sel_px), 6, (255, 0, 0), -1)
-                
-                # Label
-                label = f"{y_point:.3f}"
-                cv2.putText(canvas, label, (x_sel_px + 8, y_sel_px - 8), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        # Draw function curve, one polyline per continuous segment
+        p.polylines(self.curve_points(), self.curve_color, 2)
         
         # Draw asymptotes for tan/cot/sec/csc
         if self.func in ("tan", "sec"):
@@ -503,164 +839,706 @@ class WebTrigSimulator:
                 xpos = 90 + 180*k
                 if self.x_left - 1 <= xpos <= self.x_right + 1:
                     x_px = deg_to_x(xpos)
-                    cv2.line(canvas, (x_px, graph_y), (x_px, graph_y + graph_h), (100, 100, 100), 1, cv2.LINE_AA)
+                    p.line((x_px, graph_y), (x_px, graph_y + graph_h), (100, 100, 100), 1, aa=True)
         if self.func in ("cot", "csc"):
             k_vals = np.arange(math.floor(self.x_left/180)-1, math.ceil(self.x_right/180)+1)
             for k in k_vals:
                 xpos = 180 * k
                 if self.x_left - 1 <= xpos <= self.x_right + 1:
                     x_px = deg_to_x(xpos)
-                    cv2.line(canvas, (x_px, graph_y), (x_px, graph_y + graph_h), (100, 100, 100), 1, cv2.LINE_AA)
+                    p.line((x_px, graph_y), (x_px, graph_y + graph_h), (100, 100, 100), 1, aa=True)
         
         # Draw labels (properly spaced to avoid overlap)
         # Function name at top left
-        cv2.putText(canvas, f"{self.func}(x)", (10, 25), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-        # Angle info at top right (without degree symbol to avoid question marks)
-        angle_text = f"Angle: {self.angle_deg:.1f} deg"
-        (text_width, text_height), _ = cv2.getTextSize(angle_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
-        cv2.putText(canvas, angle_text, (self.width - text_width - 15, 25), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (240, 240, 240), 1)
+        p.text(f"{self.func}(x)", (10, 25), 0.7, self.curve_color, 2)
         # X range at bottom left (without degree symbols)
         x_range_text = f"X: [{self.x_left} to {self.x_right}] deg"
-        cv2.putText(canvas, x_range_text, (10, self.height - 15), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+        p.text(x_range_text, (10, self.height - 15), 0.5, (200, 200, 200), 1)
         # Y range at bottom right
         y_range_text = f"Y: [-{self.y_clip:.1f} to {self.y_clip:.1f}]"
         (y_text_width, _), _ = cv2.getTextSize(y_range_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-        cv2.putText(canvas, y_range_text, (self.width - y_text_width - 15, self.height - 15), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
-        
+        p.text(y_range_text, (self.width - y_text_width - 15, self.height - 15), 0.5, (200, 200, 200), 1)
+    
+    def update(self):
+        # Start from the cached static layer; only the angle marker changes per frame
+        canvas = self.background().copy()
+        self.draw(RasterPainter(canvas))
         return canvas
+    
+    def scene(self):
+        """Current frame as vector ops (see VectorPainter)"""
+        painter = VectorPainter(self.background_ops())
+        self.draw(painter)
+        return painter.ops
+    
+    def draw(self, p):
+        """Draw the angle marker and readout"""
+        graph_x, graph_y, graph_w, graph_h = self.graph_rect()
+        deg_to_x = self.deg_to_x
+        y_to_pixel = self.y_to_pixel
+        
+        # Draw vertical marker at selected angle
+        x_sel = float(self.angle_deg)
+        if self.x_left <= x_sel <= self.x_right:
+            x_sel_px = deg_to_x(x_sel)
+            p.line((x_sel_px, graph_y), (x_sel_px, graph_y + graph_h), (0, 255, 0), 1, aa=True)
+            
+            # Draw point marker
+            y_sel, ok = self.compute_trig(self.func, np.array([self.deg2rad(x_sel)]))
+            y_point = y_sel[0] if ok[0] and np.isfinite(y_sel[0]) and abs(y_sel[0]) <= self.y_clip else None
+            
+            if y_point is not None:
+                y_sel_px = y_to_pixel(y_point)
+                p.circle((x_sel_px, y_sel_px), 6, (255, 0, 0), -1)
+                
+                # Label
+                label = f"{y_point:.3f}"
+                p.text(label, (x_sel_px + 8, y_sel_px - 8), 0.5, (255, 255, 255), 1)
+        
+        # Angle info at top right (without degree symbol to avoid question marks)
+        angle_text = f"Angle: {self.angle_deg:.1f} deg"
+        (text_width, text_height), _ = cv2.getTextSize(angle_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
+        p.text(angle_text, (self.width - text_width - 15, 25), 0.6, (240, 240, 240), 1)
 
-# ==================== Helper Functions ====================
+# Simulator types served under each subject's API
+PHYSICS_SIMULATORS = {
+    'projectile': WebProjectileSimulator,
+    'optics': WebOpticsSimulator,
+    'wave': WebWaveSimulator,
+    'rotational': WebRotationalSimulator,
+}
+MATHS_SIMULATORS = {
+    'trig': WebTrigSimulator,
+}
+SIMULATOR_CLASSES = {**PHYSICS_SIMULATORS, **MATHS_SIMULATORS}
 
-def image_to_base64(img):
-    """Convert OpenCV image to base64 string"""
-    _, buffer = cv2.imencode('.png', img)
-    img_base64 = base64.b64encode(buffer).decode('utf-8')
-    return img_base64
+# Idle instances kept per simulator type for reuse by new sessions
+SIMULATOR_POOL_SIZE = int(os.environ.get('SIMULATOR_POOL_SIZE', 4))
 
-# ---------------- Play audio helper ----------------
-def play_audio_file(path):
-    """Play an audio file non-blocking. Uses pygame if available, falls back to os.startfile (Windows)."""
-    try:
-        # Only run in main Werkzeug process to avoid double-play during reload
-        if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
-            return
+class SimulatorPool:
+    """Per-type free lists of reset simulator instances.
 
-        # Try pygame first (if available)
-        try:
-            import pygame
-            pygame.mixer.init()
-            pygame.mixer.music.load(path)
-            pygame.mixer.music.play()  # non-blocking
-            print(f"▶️ Playing audio via pygame: {path}")
-            return
-        except Exception as e_pyg:
-            print(f"⚠️ pygame play failed: {e_pyg}; trying os.startfile fallback")
+    Sessions check an instance out at start and return it at stop or eviction,
+    so page loads reuse allocated buffers and caches instead of constructing
+    (and later garbage-collecting) a fresh simulator each time.
+    """
+    def __init__(self, max_idle=SIMULATOR_POOL_SIZE):
+        self.max_idle = max_idle
+        self.idle = {simulator_id: [] for simulator_id in SIMULATOR_CLASSES}
+        self.lock = threading.Lock()
+    
+    def acquire(self, simulator_id):
+        """Check out an idle instance, or construct one if the pool is empty"""
+        with self.lock:
+            free = self.idle[simulator_id]
+            if free:
+                return free.pop()
+        return SIMULATOR_CLASSES[simulator_id]()
+    
+    def release(self, simulator_id, sim):
+        """Reset an instance and keep it if there's room (reset happens here so acquire stays cheap)"""
+        sim.reset()
+        sim.frame_cache = None
+        sim.scene_cache = None
+        with self.lock:
+            free = self.idle[simulator_id]
+            if len(free) < self.max_idle:
+                free.append(sim)
+    
+    def prewarm(self):
+        """Fill every type's pool, rendering one frame each so buffers and shared layers are allocated"""
+        for simulator_id in SIMULATOR_CLASSES:
+            with self.lock:
+                missing = self.max_idle - len(self.idle[simulator_id])
+            for _ in range(missing):
+                sim = SIMULATOR_CLASSES[simulator_id]()
+                render_simulator(simulator_id, sim)
+                self.release(simulator_id, sim)
+    
+    def idle_count(self):
+        with self.lock:
+            return sum(len(free) for free in self.idle.values())
 
-        # Fallback for Windows (open with default app)
-        if os.name == 'nt':
-            try:
-                os.startfile(path)
-                print(f"▶️ Opened audio with os.startfile: {path}")
-                return
-            except Exception as e_os:
-                print(f"❌ os.startfile fallback failed: {e_os}")
+simulator_pool = SimulatorPool()
 
-        print("⚠️ No available method to play audio on this platform.")
-    except Exception as e:
-        print(f"❌ Error in play_audio_file: {e}")
+# ==================== Session Management ====================
 
-def play_most_recent_audio(temp_dir='temp_audio', specific_path=None):
-    """If specific_path provided, play it; otherwise pick newest .mp3 in temp_dir. Runs in background thread."""
-    try:
-        if specific_path and os.path.exists(specific_path):
-            path = specific_path
-        else:
-            if not os.path.exists(temp_dir):
-                print("⚠️ temp_audio folder does not exist.")
-                return
-            mp3s = [os.path.join(temp_dir, f) for f in os.listdir(temp_dir) if f.lower().endswith('.mp3')]
-            if not mp3s:
-                print("⚠️ No mp3 files found in temp_audio.")
-                return
-            path = max(mp3s, key=os.path.getmtime)
-        # Spawn daemon thread so request handling isn't blocked
-        t = threading.Thread(target=play_audio_file, args=(path,), daemon=True)
-        t.start()
-    except Exception as e:
-        print(f"❌ Error in play_most_recent_audio: {e}")
-# ---------------------------------------------------
+# Idle sessions are evicted after this many seconds; least recently used sessions
+# are evicted while the estimated simulator memory exceeds the cap.
+SESSION_IDLE_TTL = float(os.environ.get('SESSION_IDLE_TTL', 900))
+SESSION_MEMORY_CAP_MB = float(os.environ.get('SESSION_MEMORY_CAP_MB', 1024))
+SESSION_REAP_INTERVAL = 30.0
 
-# ==================== API Routes ====================
+# Multi-process deployment: each server process has its own port and instance id.
+# The instance id is the session-affinity key a front proxy routes on.
+SERVER_PORT = int(os.environ.get('PORT', 5000))
+INSTANCE_ID = os.environ.get('INSTANCE_ID', f'{socket.gethostname()}:{SERVER_PORT}')
+# Path of a SQLite file shared by all processes on the host; unset keeps sessions process-local
+SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH')
+SESSION_STORE_TOUCH_INTERVAL = 30.0  # Seconds between last_access writes to the shared store
 
-@app.route('/api/physics/simulators', methods=['GET'])
-def list_simulators():
-    """List available physics simulators"""
-    return jsonify({
-        'simulators': [
-            {'id': 'projectile', 'name': 'Projectile Motion', 'description': 'Gesture-controlled projectile simulation'},
-            {'id': 'optics', 'name': 'Optics Simulator', 'description': 'Lens and mirror ray tracing'},
-            {'id': 'wave', 'name': 'Wave Interference', 'description': 'Wave interference patterns'},
-            {'id': 'rotational', 'name': 'Rotational Motion', 'description': 'Circular motion visualization'}
-        ]
-    })
+def estimate_memory(obj, seen=None):
+    """Rough bytes held in NumPy arrays and encoded frames reachable from obj's attributes"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        # Views share their base's memory; read-only shared layers aren't owned by a session
+        return obj.nbytes if obj.base is None and obj.flags.writeable else 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(estimate_memory(v, seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_memory(v, seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return estimate_memory(vars(obj), seen)
+    return 0
 
-@app.route('/api/maths/simulators', methods=['GET'])
-def list_maths_simulators():
-    """List available mathematics simulators"""
-    return jsonify({
-        'simulators': [
-            {'id': 'trig', 'name': 'Trigonometric Visualizer', 'description': 'Interactive trigonometric graph with angle marker'}
-        ]
-    })
+def session_memory(sim, encoders):
+    """Estimated bytes held by a session: the simulator plus its encoder state,
+    which includes the full previous frame kept for delta updates"""
+    return estimate_memory([sim, encoders])
 
-@app.route('/api/physics/simulator/<simulator_id>/start', methods=['POST'])
-def start_simulator(simulator_id):
-    """Start a simulator instance"""
-    session_id = request.json.get('session_id', f'session_{int(time.time())}')
+class InProcessSessionStore:
+    """Session ownership records for a single server process"""
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
     
-    with simulator_lock:
-        if simulator_id == 'projectile':
-            active_simulators[session_id] = WebProjectileSimulator()
-        elif simulator_id == 'optics':
-            active_simulators[session_id] = WebOpticsSimulator()
-        elif simulator_id == 'wave':
-            active_simulators[session_id] = WebWaveSimulator()
-        elif simulator_id == 'rotational':
-            active_simulators[session_id] = WebRotationalSimulator()
-        else:
-            return jsonify({'error': 'Unknown simulator'}), 400
+    def register(self, session_id, simulator_id, owner):
+        with self.lock:
+            self.records[session_id] = {'simulator_id': simulator_id, 'owner': owner,
+                                        'last_access': time.time()}
     
-    return jsonify({'session_id': session_id, 'status': 'started'})
-
-@app.route('/api/maths/simulator/<simulator_id>/start', methods=['POST'])
-def start_maths_simulator(simulator_id):
-    """Start a mathematics simulator instance"""
-    session_id = request.json.get('session_id', f'session_{int(time.time())}')
+    def lookup(self, session_id):
+        with self.lock:
+            record = self.records.get(session_id)
+            return dict(record) if record is not None else None
     
-    with simulator_lock:
-        if simulator_id == 'trig':
-            active_simulators[session_id] = WebTrigSimulator()
-        else:
-            return jsonify({'error': 'Unknown simulator'}), 400
+    def touch(self, session_id):
+        with self.lock:
+            if session_id in self.records:
+                self.records[session_id]['last_access'] = time.time()
     
-    return jsonify({'session_id': session_id, 'status': 'started'})
-
-@app.route('/api/physics/simulator/<simulator_id>/update', methods=['POST'])
-def update_simulator(simulator_id):
-    """Update simulator state and get frame"""
-    session_id = request.json.get('session_id')
-    params = request.json.get('params', {})
+    def remove(self, session_id, owner):
+        """Drop a record, but only if owner still holds it (the id may have been restarted elsewhere)"""
+        with self.lock:
+            record = self.records.get(session_id)
+            if record is not None and record['owner'] == owner:
+                del self.records[session_id]
     
-    if session_id not in active_simulators:
-        return jsonify({'error': 'Simulator not found'}), 404
+    def purge(self, cutoff):
+        """Drop records not touched since cutoff (e.g. left behind by a dead process)"""
+        with self.lock:
+            for sid in [sid for sid, r in self.records.items() if r['last_access'] < cutoff]:
+                del self.records[sid]
+    
+    def count(self):
+        with self.lock:
+            return len(self.records)
+
+class SQLiteSessionStore:
+    """Session ownership records shared by every server process on the host.
+
+    Only the record (who owns a session) is shared; the simulator itself stays in
+    the owning process, so requests must be routed there by affinity key.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                         'session_id TEXT PRIMARY KEY, simulator_id TEXT, '
+                         'owner TEXT, last_access REAL)')
+    
+    @contextlib.contextmanager
+    def connect(self):
+        """Connection in a transaction, committed (or rolled back) and then closed.
+
+        A connection per call keeps the store safe to use from any thread.
+        """
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def register(self, session_id, simulator_id, owner):
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)',
+                         (session_id, simulator_id, owner, time.time()))
+    
+    def lookup(self, session_id):
+        with self.connect() as conn:
+            row = conn.execute('SELECT simulator_id, owner, last_access FROM sessions '
+                               'WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {'simulator_id': row[0], 'owner': row[1], 'last_access': row[2]}
+    
+    def touch(self, session_id):
+        with self.connect() as conn:
+            conn.execute('UPDATE sessions SET last_access = ? WHERE session_id = ?',
+                         (time.time(), session_id))
+    
+    def remove(self, session_id, owner):
+        """Drop a record, but only if owner still holds it (the id may have been restarted elsewhere)"""
+        with self.connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE session_id = ? AND owner = ?',
+                         (session_id, owner))
+    
+    def purge(self, cutoff):
+        """Drop records not touched since cutoff (e.g. left behind by a dead process)"""
+        with self.connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE last_access < ?', (cutoff,))
+    
+    def count(self):
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+def create_session_store(path=SESSION_STORE_PATH):
+    """Shared SQLite store when SESSION_STORE_PATH is set, otherwise process-local"""
+    if path:
+        return SQLiteSessionStore(path)
+    return InProcessSessionStore()
+
+class SimulatorSession:
+    """A running simulator plus its per-session settings and bookkeeping.
+
+    lock serializes everything that mutates or renders this session's simulator,
+    so different sessions render in parallel while one session never races itself.
+    """
+    def __init__(self, session_id, simulator_id, sim, settings):
+        self.session_id = session_id
+        self.simulator_id = simulator_id
+        self.sim = sim
+        self.settings = settings
+        self.created = time.time()
+        self.last_access = self.created
+        self.store_touched = self.created
+        self.lock = threading.Lock()
+        self.closed = False
+        self.remote = isinstance(sim, RemoteSimulator)
+        self.encoders = None if self.remote else session_encoders(settings)
+        self.memory = 0 if self.remote else session_memory(sim, self.encoders)
+    
+    def remote_call(self, method, *args):
+        """Call the remote simulator; if its worker died the session is closed (caller holds lock)"""
+        try:
+            return method(*args)
+        except RenderWorkerLost as e:
+            self.closed = True
+            e.session = self
+            raise
+    
+    def apply_params(self, params):
+        """Apply client parameters (caller holds lock)"""
+        if self.remote:
+            self.remote_call(self.sim.apply_params, params)
+        else:
+            apply_simulator_params(self.simulator_id, self.sim, params)
+    
+    def frame(self, dt=0.033, params=None, stream=False):
+        """Apply params (if any) and return the encoded frame as (bytes, mimetype, etag, encode_ms).
+
+        stream selects the MJPEG encoder instead of the negotiated one; caller holds lock.
+        """
+        if self.remote:
+            return self.remote_call(self.sim.frame, dt, params, stream)
+        if params:
+            apply_simulator_params(self.simulator_id, self.sim, params)
+        encoder = self.encoders['stream' if stream else 'frame']
+        return simulator_frame(self.simulator_id, self.sim, encoder, dt=dt)
+    
+    def scene(self, params=None):
+        """Apply params (if any) and return (vector ops, etag); caller holds lock"""
+        if self.remote:
+            return self.remote_call(self.sim.scene, params)
+        if params:
+            apply_simulator_params(self.simulator_id, self.sim, params)
+        return simulator_scene(self.simulator_id, self.sim)
+    
+    def delta_frame(self, base_seq, dt=0.033, params=None):
+        """Apply params (if any) and return a dirty-tile update (see DeltaTracker.frame); caller holds lock"""
+        if self.remote:
+            return self.remote_call(self.sim.delta_frame, base_seq, dt, params)
+        if params:
+            apply_simulator_params(self.simulator_id, self.sim, params)
+        return delta_frame(self.simulator_id, self.sim, self.encoders, base_seq, dt=dt)
+    
+    def close(self):
+        """Release the simulator when the session is stopped or evicted.
+
+        Waits for any in-flight frame; afterwards closed is set and the simulator
+        may belong to another session, so holders of this session must check it.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.remote:
+                self.sim.close()
+            else:
+                simulator_pool.release(self.simulator_id, self.sim)
+    
+    def memory_bytes(self):
+        """Estimated simulator memory; reuses the last estimate if the session is busy"""
+        if self.remote:
+            return self.sim.memory
+        if self.lock.acquire(blocking=False):
+            try:
+                if not self.closed:
+                    self.memory = session_memory(self.sim, self.encoders)
+            finally:
+                self.lock.release()
+        return self.memory
+
+class SessionManager:
+    """Registry of active simulator sessions with idle TTL and LRU memory-cap eviction.
+
+    lock only guards the registry itself; simulator work happens under each
+    session's own lock. Ownership is mirrored into store so other server
+    processes can tell a misrouted session from a missing one.
+    """
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, memory_cap_mb=SESSION_MEMORY_CAP_MB,
+                 reap_interval=SESSION_REAP_INTERVAL, store=None, instance_id=INSTANCE_ID):
+        self.store = store if store is not None else InProcessSessionStore()
+        self.instance_id = instance_id
+        self.idle_ttl = idle_ttl
+        self.memory_cap = int(memory_cap_mb * 1024 * 1024)
+        self.reap_interval = reap_interval
+        self.sessions = OrderedDict()  # Least recently used first
+        self.lock = threading.Lock()
+        self.reaper = None
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+    
+    def start(self, session_id, simulator_id, sim, settings):
+        """Register a new session (replacing any with the same id) and enforce the memory cap"""
+        session = SimulatorSession(session_id, simulator_id, sim, settings)
+        with self.lock:
+            removed = [self.sessions.pop(session_id, None)]
+            self.sessions[session_id] = session
+            removed += self.evict_over_cap(keep=session_id)
+        self.close_all(removed)
+        self.store.register(session_id, simulator_id, self.instance_id)
+        self.start_reaper()
+        return session
+    
+    def get(self, session_id):
+        """Look up a session and mark it as recently used (None if missing)"""
+        touch = False
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.time()
+                self.sessions.move_to_end(session_id)
+                if session.last_access - session.store_touched > SESSION_STORE_TOUCH_INTERVAL:
+                    session.store_touched = session.last_access
+                    touch = True
+        if touch:
+            self.store.touch(session_id)
+        return session
+    
+    def owner(self, session_id):
+        """Affinity key of the process that owns session_id, or None if no process does"""
+        record = self.store.lookup(session_id)
+        return record['owner'] if record is not None else None
+    
+    def stop(self, session_id):
+        """Remove a session, returns False if it didn't exist"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        self.close_all([session])
+        return session is not None
+    
+    def discard(self, session):
+        """Remove session if it is still the one registered under its id (e.g. its worker died)"""
+        with self.lock:
+            if self.sessions.get(session.session_id) is session:
+                del self.sessions[session.session_id]
+            else:
+                session = None
+        self.close_all([session])
+    
+    def close_all(self, removed):
+        """Close removed sessions and release their store records, outside the registry lock"""
+        for session in removed:
+            if session is not None:
+                session.close()
+                self.store.remove(session.session_id, self.instance_id)
+    
+    def memory_usage(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return sum(s.memory_bytes() for s in sessions)
+    
+    def evict_over_cap(self, keep=None):
+        """Drop least recently used sessions while over the memory cap (caller holds lock).
+
+        Returns the evicted sessions so the caller can close them.
+        """
+        usage = {sid: s.memory_bytes() for sid, s in self.sessions.items()}
+        total = sum(usage.values())
+        evicted = []
+        for sid in list(self.sessions):
+            if total <= self.memory_cap:
+                break
+            if sid == keep:
+                continue
+            evicted.append(self.sessions.pop(sid))
+            total -= usage[sid]
+            print(f"♻️ Evicted session {sid} (memory cap)")
+        return evicted
+    
+    def reap(self):
+        """Evict idle sessions, then enforce the memory cap"""
+        cutoff = time.time() - self.idle_ttl
+        evicted = []
+        with self.lock:
+            for sid in [sid for sid, s in self.sessions.items() if s.last_access < cutoff]:
+                evicted.append(self.sessions.pop(sid))
+                print(f"♻️ Evicted session {sid} (idle)")
+            evicted += self.evict_over_cap()
+        self.close_all(evicted)
+        # Records that no live process has touched within the TTL belong to dead processes
+        self.store.purge(cutoff)
+    
+    def start_reaper(self):
+        """Start the background reaper thread once"""
+        if self.reaper is not None:
+            return
+        def run():
+            while True:
+                time.sleep(self.reap_interval)
+                try:
+                    self.reap()
+                except Exception as e:
+                    print(f"❌ Session reaper error: {e}")
+        self.reaper = threading.Thread(target=run, daemon=True)
+        self.reaper.start()
+
+# Global registry of active simulator sessions (render workers never serve requests)
+active_simulators = SessionManager(store=InProcessSessionStore() if IS_RENDER_WORKER else create_session_store())
+
+# ==================== Helper Functions ====================
+
+def image_to_base64(img):
+    """Convert OpenCV image to base64 string"""
+    _, buffer = cv2.imencode('.png', img)
+    img_base64 = base64.b64encode(buffer).decode('utf-8')
+    return img_base64
+
+# Supported frame encodings: format -> (OpenCV extension, mimetype)
+FRAME_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    'raw': (None, 'application/octet-stream'),  # Uncompressed RGBA, size from X-Frame-Width/Height
+}
+AUTO_FORMATS = ['raw', 'jpeg', 'webp', 'png']  # Candidates for frame_format='auto'
+AUTO_REPROBE_INTERVAL = 120  # Frames between re-measuring a non-chosen auto candidate
+
+def encode_frame(img, fmt='png', quality=80, png_compression=None):
+    """Encode OpenCV image to raw bytes, returns (bytes, mimetype).
+
+    png_compression None keeps OpenCV's default PNG settings (a fast level and
+    RLE strategy), which beats every explicit level on our frames.
+    """
+    ext, mimetype = FRAME_FORMATS.get(fmt, FRAME_FORMATS['png'])
+    if fmt == 'raw':
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGBA).tobytes(), mimetype
+    params = []
+    if fmt == 'jpeg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif fmt == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    elif fmt == 'png' and png_compression is not None:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    _, buffer = cv2.imencode(ext, img, params)
+    return buffer.tobytes(), mimetype
+
+class FrameEncoder:
+    """Per-session encoder built from the settings negotiated at /start.
+
+    With frame_format='auto' it measures each accepted format on live frames
+    (moving average of encode time and size) and uses the fastest one whose
+    frames fit max_frame_bytes, or the smallest if none fit.
+    """
+    def __init__(self, settings):
+        self.fmt = settings['frame_format']
+        self.quality = settings['quality']
+        self.png_compression = settings['png_compression']
+        self.max_frame_bytes = settings['max_frame_bytes']
+        self.candidates = [f for f in AUTO_FORMATS if f in settings['accept_formats']]
+        self.stats = {}  # format -> [avg encode ms, avg bytes, samples]
+        self.frames = 0
     
-    sim = active_simulators[session_id]
+    def cache_key(self):
+        return (self.fmt, self.quality, self.png_compression, self.max_frame_bytes)
     
-    # Update parameters based on simulator type
+    def choose(self):
+        """Format for the next frame"""
+        if self.fmt != 'auto':
+            return self.fmt
+        for f in self.candidates:
+            if f not in self.stats or self.stats[f][2] < 2:
+                return f
+        self.frames += 1
+        if self.frames % AUTO_REPROBE_INTERVAL == 0:
+            # Content changes over time, so periodically refresh one candidate's numbers
+            return self.candidates[(self.frames // AUTO_REPROBE_INTERVAL) % len(self.candidates)]
+        fits = [f for f in self.candidates
+                if not self.max_frame_bytes or self.stats[f][1] <= self.max_frame_bytes]
+        if fits:
+            return min(fits, key=lambda f: self.stats[f][0])
+        return min(self.candidates, key=lambda f: self.stats[f][1])
+    
+    def encode(self, img):
+        """Encode a frame, returns (bytes, mimetype, encode_ms)"""
+        fmt = self.choose()
+        start = time.perf_counter()
+        body, mimetype = encode_frame(img, fmt, self.quality, self.png_compression)
+        encode_ms = (time.perf_counter() - start) * 1000.0
+        if self.fmt == 'auto':
+            stat = self.stats.get(fmt)
+            if stat is None or stat[2] < 2:
+                # The first encode of a format pays one-off setup costs, so the second replaces it
+                self.stats[fmt] = [encode_ms, len(body), (stat[2] if stat else 0) + 1]
+            else:
+                stat[0] += 0.2 * (encode_ms - stat[0])
+                stat[1] += 0.2 * (len(body) - stat[1])
+        return body, mimetype, encode_ms
+
+# Delta updates: frames are diffed against the last one sent in DELTA_TILE squares
+DELTA_TILE = 32
+DELTA_MAX_FRACTION = 0.5  # Send a full frame instead once this much of it changed
+
+def dirty_rects(prev, cur, tile=DELTA_TILE):
+    """Bounding boxes (x, y, w, h) of changed tiles between two same-sized frames.
+
+    Changed tiles are merged into horizontal runs per tile row, and runs with the
+    same columns in consecutive rows are merged into one rectangle.
+    """
+    h, w = cur.shape[:2]
+    changed = np.any(prev != cur, axis=2)
+    rows = np.logical_or.reduceat(changed, np.arange(0, h, tile), axis=0)
+    mask = np.logical_or.reduceat(rows, np.arange(0, w, tile), axis=1)
+    
+    rects = []
+    open_runs = {}  # (col_start, col_end) -> rect still growing downwards
+    for r in range(mask.shape[0]):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], mask[r].view(np.int8), [0]))))
+        runs = {}
+        for c0, c1 in zip(edges[::2], edges[1::2]):
+            rect = open_runs.get((c0, c1))
+            if rect is None:
+                rect = [c0, r, c1 - c0, 0]
+                rects.append(rect)
+            rect[3] += 1
+            runs[(c0, c1)] = rect
+        open_runs = runs
+    
+    return [(int(c * tile), int(r * tile), int(min(cw * tile, w - c * tile)), int(min(rh * tile, h - r * tile)))
+            for c, r, cw, rh in rects]
+
+class DeltaTracker:
+    """Last frame sent to a session's client, so updates can carry only changed tiles"""
+    def __init__(self):
+        self.prev = None
+        self.seq = 0
+        self.state_key = None
+    
+    def frame(self, canvas, base_seq, encoder, state_key=None):
+        """Diff canvas against the last sent frame and return the update as a dict.
+
+        A client whose base_seq isn't the last sent frame gets a full frame
+        ('full': (bytes, mimetype)); otherwise 'tiles' lists encoded changed regions.
+        """
+        start = time.perf_counter()
+        rects = None
+        if self.prev is not None and base_seq == self.seq and self.prev.shape == canvas.shape:
+            rects = dirty_rects(self.prev, canvas)
+            if sum(w * h for _, _, w, h in rects) > DELTA_MAX_FRACTION * canvas.shape[0] * canvas.shape[1]:
+                rects = None
+        self.prev = canvas
+        self.state_key = state_key
+        self.seq += 1
+        
+        result = {'seq': self.seq}
+        if rects is None:
+            body, mimetype, _ = encoder.encode(canvas)
+            result['full'] = (body, mimetype)
+        else:
+            fmt = encoder.fmt if encoder.fmt in ('png', 'jpeg', 'webp') else 'png'
+            result['tiles'] = []
+            for x, y, w, h in rects:
+                body, mimetype = encode_frame(canvas[y:y + h, x:x + w], fmt, encoder.quality,
+                                              encoder.png_compression)
+                result['tiles'].append((x, y, w, h, body, mimetype))
+        result['encode_ms'] = (time.perf_counter() - start) * 1000.0
+        return result
+
+def session_encoders(settings):
+    """Per-session encoder state: 'frame' for updates/WebSocket, 'stream' (always JPEG)
+    for MJPEG, and 'delta' for dirty-tile updates"""
+    return {
+        'frame': FrameEncoder(settings),
+        'stream': FrameEncoder({**settings, 'frame_format': 'jpeg'}),
+        'delta': DeltaTracker(),
+    }
+
+def settings_int(data, key, default, low, high):
+    """data[key] as an int clamped to [low, high]; default if missing or not a number"""
+    try:
+        value = int(data.get(key, default))
+    except (TypeError, ValueError, OverflowError):
+        return default
+    return max(low, min(high, value))
+
+def parse_frame_settings(data, simulator_id=None):
+    """Read frame response settings from a /start request body.
+
+    render_mode: 'raster' (default) or 'vector' (primitive list, for simulators with scene())
+    response_mode: 'json' (base64 data URL, default) or 'binary' (raw image body)
+    frame_format: 'png' (default), 'jpeg', 'webp', 'raw' (RGBA bytes) or 'auto'
+    quality: 1-100, used by jpeg/webp
+    png_compression: 0-9, or None (default) for OpenCV's own fast setting
+    max_frame_bytes: size budget for 'auto' (0 = none, pick the fastest)
+    accept_formats: formats 'auto' may pick (default png, jpeg, webp)
+    """
+    data = data or {}
+    mode = data.get('response_mode', 'json')
+    fmt = data.get('frame_format', 'png')
+    # Unknown or malformed values fall back to the defaults
+    if mode not in ('json', 'binary'):
+        mode = 'json'
+    if not isinstance(fmt, str) or (fmt not in FRAME_FORMATS and fmt != 'auto'):
+        fmt = 'png'
+    quality = settings_int(data, 'quality', 80, 1, 100)
+    png_compression = settings_int(data, 'png_compression', None, 0, 9)
+    max_frame_bytes = settings_int(data, 'max_frame_bytes', 0, 0, 2 ** 31)
+    accept = data.get('accept_formats')
+    if not isinstance(accept, list):
+        accept = ['png', 'jpeg', 'webp']
+    accept = [f for f in accept if isinstance(f, str) and f in FRAME_FORMATS]
+    render_mode = data.get('render_mode', 'raster')
+    if render_mode != 'vector' or not hasattr(SIMULATOR_CLASSES.get(simulator_id), 'scene'):
+        render_mode = 'raster'
+    return {'response_mode': mode, 'frame_format': fmt, 'quality': quality,
+            'png_compression': png_compression, 'max_frame_bytes': max_frame_bytes,
+            'accept_formats': accept or ['png'], 'render_mode': render_mode}
+
+def apply_simulator_params(simulator_id, sim, params):
+    """Apply client parameters to a simulator based on its type"""
     if simulator_id == 'projectile':
         if 'launch' in params:
             sim.launch(params['launch']['velocity'], params['launch']['angle'])
@@ -686,38 +1564,14 @@ def update_simulator(simulator_id):
                 s['amp'] = params['amp']
         if 'paused' in params:
             sim.paused = params['paused']
+        if params.get('quality_mode') in WAVE_QUALITY_SCALES:
+            sim.quality_mode = params['quality_mode']
     elif simulator_id == 'rotational':
         if 'radius' in params:
             sim.radius_m = params['radius']
         if 'omega' in params:
             sim.omega = params['omega']
-    
-    # Get frame
-    if simulator_id == 'wave':
-        canvas = sim.update(dt=0.033)
-    else:
-        canvas = sim.update()
-    
-    img_base64 = image_to_base64(canvas)
-    
-    return jsonify({
-        'frame': f'data:image/png;base64,{img_base64}',
-        'timestamp': time.time()
-    })
-
-@app.route('/api/maths/simulator/<simulator_id>/update', methods=['POST'])
-def update_maths_simulator(simulator_id):
-    """Update mathematics simulator state and get frame"""
-    session_id = request.json.get('session_id')
-    params = request.json.get('params', {})
-    
-    if session_id not in active_simulators:
-        return jsonify({'error': 'Simulator not found'}), 404
-    
-    sim = active_simulators[session_id]
-    
-    # Update parameters for trig simulator
-    if simulator_id == 'trig':
+    elif simulator_id == 'trig':
         if 'func' in params:
             sim.func = params['func']
         if 'angle_deg' in params:
@@ -730,186 +1584,1240 @@ def update_maths_simulator(simulator_id):
             sim.y_clip = float(params['y_clip'])
         if 'show_grid' in params:
             sim.show_grid = bool(params['show_grid'])
+
+def render_simulator(simulator_id, sim, dt=0.033):
+    """Advance a simulator and render its current frame"""
+    if simulator_id == 'wave':
+        return sim.update(dt=dt)
+    return sim.update()
+
+def simulator_frame(simulator_id, sim, encoder, dt=0.033):
+    """Render and encode the current frame, returns (bytes, mimetype, etag, encode_ms).
+
+    Simulators whose state_key() is not None are pure functions of that key;
+    their last encoded frame is kept on the simulator and reused while the
+    key is unchanged, so idle or paused sessions skip rendering entirely.
+    """
+    state_key = sim.state_key() if hasattr(sim, 'state_key') else None
+    if state_key is not None:
+        key = (simulator_id, state_key, encoder.cache_key())
+        cache = getattr(sim, 'frame_cache', None)
+        if cache is not None and cache[0] == key:
+            return cache[1], cache[2], cache[3], 0.0
     
-    # Get frame
-    canvas = sim.update()
-    img_base64 = image_to_base64(canvas)
+    canvas = render_simulator(simulator_id, sim, dt=dt)
+    body, mimetype, encode_ms = encoder.encode(canvas)
     
-    return jsonify({
-        'frame': f'data:image/png;base64,{img_base64}',
+    etag = None
+    if state_key is not None:
+        etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        sim.frame_cache = (key, body, mimetype, etag)
+    return body, mimetype, etag, encode_ms
+
+def simulator_scene(simulator_id, sim):
+    """Current frame as vector ops, returns (ops, etag); cached on state_key like simulator_frame"""
+    state_key = sim.state_key() if hasattr(sim, 'state_key') else None
+    if state_key is not None:
+        key = (simulator_id, state_key, 'vector')
+        cache = getattr(sim, 'scene_cache', None)
+        if cache is not None and cache[0] == key:
+            return cache[1], cache[2]
+    
+    ops = sim.scene()
+    
+    etag = None
+    if state_key is not None:
+        etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        sim.scene_cache = (key, ops, etag)
+    return ops, etag
+
+def delta_frame(simulator_id, sim, encoders, base_seq, dt=0.033):
+    """Render the current frame as a dirty-tile update against the client's base_seq frame"""
+    tracker = encoders['delta']
+    state_key = sim.state_key() if hasattr(sim, 'state_key') else None
+    if state_key is not None and state_key == tracker.state_key and base_seq == tracker.seq:
+        # Nothing the frame depends on changed since the client's frame
+        return {'seq': tracker.seq, 'tiles': [], 'encode_ms': 0.0}
+    canvas = render_simulator(simulator_id, sim, dt=dt)
+    return tracker.frame(canvas, base_seq, encoders['frame'], state_key)
+
+def session_not_found(session_id):
+    """404 for unknown sessions, or 421 with the owner's affinity key if another process has it"""
+    owner = active_simulators.owner(session_id)
+    if owner is not None and owner != active_simulators.instance_id:
+        return jsonify({'error': 'Session is owned by another server process',
+                        'affinity': owner}), 421
+    return jsonify({'error': 'Simulator not found'}), 404
+
+def frame_response(session, params=None, delta=False, base_seq=None):
+    """Apply params and build the update response for the current frame (caller holds session lock).
+
+    With delta, a client holding frame base_seq gets only the changed tiles (always JSON).
+    """
+    if session.closed:  # Stopped while this request waited for the lock
+        return session_not_found(session.session_id)
+    settings = session.settings
+    sim = session.sim
+    if settings['render_mode'] == 'vector':
+        return scene_response(session, params)
+    seq = None
+    if delta:
+        update = session.delta_frame(base_seq, params=params)
+        seq, encode_ms = update['seq'], update['encode_ms']
+        if 'tiles' in update:
+            resp = jsonify({
+                'delta': True,
+                'seq': seq,
+                'tiles': [{'x': x, 'y': y, 'w': w, 'h': h,
+                           'data': f'data:{mimetype};base64,{base64.b64encode(body).decode("utf-8")}'}
+                          for x, y, w, h, body, mimetype in update['tiles']],
+                'timestamp': time.time(),
+                'encode_ms': round(encode_ms, 2)
+            })
+            resp.headers['Server-Timing'] = f'encode;dur={encode_ms:.2f}'
+            return resp
+        (body, mimetype), etag = update['full'], None
+    else:
+        body, mimetype, etag, encode_ms = session.frame(params=params)
+    timestamp = time.time()
+    
+    # Client already has this exact frame
+    if etag is not None and etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    
+    if settings['response_mode'] == 'binary':
+        # Raw image body, state travels in headers
+        resp = Response(body, mimetype=mimetype)
+        resp.headers['X-Frame-Timestamp'] = f'{timestamp:.6f}'
+        resp.headers['X-Frame-Width'] = str(sim.width)
+        resp.headers['X-Frame-Height'] = str(sim.height)
+        resp.headers['X-Session-Id'] = str(session.session_id)
+        resp.headers['X-Encode-Ms'] = f'{encode_ms:.2f}'
+        resp.headers['Cache-Control'] = 'no-store'
+        if seq is not None:
+            resp.headers['X-Frame-Seq'] = str(seq)
+    else:
+        img_base64 = base64.b64encode(body).decode('utf-8')
+        payload = {
+            'frame': f'data:{mimetype};base64,{img_base64}',
+            'timestamp': timestamp,
+            'encode_ms': round(encode_ms, 2)
+        }
+        if seq is not None:
+            payload['seq'] = seq
+        resp = jsonify(payload)
+    resp.headers['Server-Timing'] = f'encode;dur={encode_ms:.2f}'
+    if etag is not None:
+        resp.set_etag(etag)
+    return resp
+
+def scene_response(session, params=None):
+    """Vector-mode update: primitive ops for the client to draw, no rasterization or encoding"""
+    ops, etag = session.scene(params=params)
+    if etag is not None and etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    resp = jsonify({
+        'scene': {'width': session.sim.width, 'height': session.sim.height, 'ops': ops},
         'timestamp': time.time()
     })
+    if etag is not None:
+        resp.set_etag(etag)
+    return resp
+
+# MJPEG stream settings
+STREAM_DEFAULT_FPS = 20
+STREAM_MAX_FPS = 30
+STREAM_BOUNDARY = 'frame'
+
+# Each open stream holds a Waitress worker thread for as long as it is connected.
+# Streams beyond STREAM_MAX_CONCURRENT get 503 (the page falls back to polling),
+# so the remaining threads are always free for ordinary requests.
+WAITRESS_THREADS = int(os.environ.get('WAITRESS_THREADS', 16))
+STREAM_MAX_CONCURRENT = int(os.environ.get('STREAM_MAX_CONCURRENT', max(1, WAITRESS_THREADS // 2)))
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENT)
+
+def mjpeg_stream(session_id, fps):
+    """Yield multipart JPEG frames for a session at a fixed target rate until it stops"""
+    interval = 1.0 / fps
+    next_frame = time.time()
+    while True:
+        session = active_simulators.get(session_id)
+        if session is None:
+            break
+        try:
+            with session.lock:
+                if session.closed:
+                    break
+                body, _, _, _ = session.frame(dt=interval, stream=True)
+        except RenderWorkerLost:
+            active_simulators.discard(session)
+            break
+        yield (f'--{STREAM_BOUNDARY}\r\n'
+               f'Content-Type: image/jpeg\r\n'
+               f'Content-Length: {len(body)}\r\n\r\n').encode('ascii') + body + b'\r\n'
+        
+        # Sleep until the next frame slot; drop slots if rendering fell behind
+        next_frame += interval
+        delay = next_frame - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.time()
+
+# ---------------- Play audio helper ----------------
+def play_audio_file(path):
+    """Play an audio file non-blocking. Uses pygame if available, falls back to os.startfile (Windows)."""
+    try:
+        # Only run in main Werkzeug process to avoid double-play during reload
+        if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+            return
+
+        # Try pygame first (if available)
+        try:
+            import pygame
+            pygame.mixer.init()
+            pygame.mixer.music.load(path)
+            pygame.mixer.music.play()  # non-blocking
+            print(f"▶️ Playing audio via pygame: {path}")
+            return
+        except Exception as e_pyg:
+            print(f"⚠️ pygame play failed: {e_pyg}; trying os.startfile fallback")
+
+        # Fallback for Windows (open with default app)
+        if os.name == 'nt':
+            try:
+                os.startfile(path)
+                print(f"▶️ Opened audio with os.startfile: {path}")
+                return
+            except Exception as e_os:
+                print(f"❌ os.startfile fallback failed: {e_os}")
+
+        print("⚠️ No available method to play audio on this platform.")
+    except Exception as e:
+        print(f"❌ Error in play_audio_file: {e}")
+
+def play_most_recent_audio(temp_dir='temp_audio', specific_path=None):
+    """If specific_path provided, play it; otherwise pick newest .mp3 in temp_dir. Runs in background thread."""
+    try:
+        if specific_path and os.path.exists(specific_path):
+            path = specific_path
+        else:
+            if not os.path.exists(temp_dir):
+                print("⚠️ temp_audio folder does not exist.")
+                return
+            mp3s = [os.path.join(temp_dir, f) for f in os.listdir(temp_dir) if f.lower().endswith('.mp3')]
+            if not mp3s:
+                print("⚠️ No mp3 files found in temp_audio.")
+                return
+            path = max(mp3s, key=os.path.getmtime)
+        # Spawn daemon thread so request handling isn't blocked
+        t = threading.Thread(target=play_audio_file, args=(path,), daemon=True)
+        t.start()
+    except Exception as e:
+        print(f"❌ Error in play_most_recent_audio: {e}")
+# ---------------------------------------------------
+
+# ==================== Render Worker Pool ====================
+
+# Optional: render simulators in worker processes instead of request threads, so
+# NumPy/OpenCV work and Python drawing loops scale across cores instead of
+# contending on the GIL. 0 keeps simulators in-process.
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 0))
+
+def render_worker_main(conn):
+    """Render worker process loop: owns the simulators for its shard of sessions"""
+    simulator_pool.prewarm()
+    sims = {}
+    while True:
+        try:
+            op, key, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if op == 'start':
+                simulator_id, settings = args
+                sim = simulator_pool.acquire(simulator_id)
+                sims[key] = (simulator_id, sim, session_encoders(settings))
+                result = (sim.width, sim.height)
+            elif op == 'stop':
+                if key in sims:
+                    simulator_id, sim, _ = sims.pop(key)
+                    simulator_pool.release(simulator_id, sim)
+                result = None
+            else:
+                simulator_id, sim, encoders = sims[key]
+                if op == 'params':
+                    apply_simulator_params(simulator_id, sim, args)
+                    result = None
+                elif op == 'frame':
+                    dt, params, stream = args
+                    if params:
+                        apply_simulator_params(simulator_id, sim, params)
+                    encoder = encoders['stream' if stream else 'frame']
+                    result = simulator_frame(simulator_id, sim, encoder, dt=dt) + (session_memory(sim, encoders),)
+                elif op == 'delta':
+                    base_seq, dt, params = args
+                    if params:
+                        apply_simulator_params(simulator_id, sim, params)
+                    result = (delta_frame(simulator_id, sim, encoders, base_seq, dt=dt), session_memory(sim, encoders))
+                elif op == 'scene':
+                    if args:
+                        apply_simulator_params(simulator_id, sim, args)
+                    result = simulator_scene(simulator_id, sim) + (session_memory(sim, encoders),)
+                else:
+                    raise ValueError(f'Unknown op {op}')
+            conn.send(('ok', result))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+class RenderWorkerLost(RuntimeError):
+    """The render worker holding a simulator exited, taking the simulator with it"""
+    session = None  # Set by SimulatorSession.remote_call
+
+class RenderWorker:
+    """A worker process and the pipe used to talk to it (one request at a time)"""
+    def __init__(self, ctx, index):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=render_worker_main, args=(child_conn,),
+                                   name=f'{RENDER_WORKER_NAME}-{index}', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+        self.lost = False
+    
+    def alive(self):
+        return not self.lost and self.process.is_alive()
+    
+    def call(self, op, key, args=None):
+        with self.lock:
+            if self.lost:
+                raise RenderWorkerLost(f'Render worker {self.process.name} exited')
+            try:
+                self.conn.send((op, key, args))
+                status, result = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self.lost = True
+                self.conn.close()
+                raise RenderWorkerLost(f'Render worker {self.process.name} exited') from e
+        if status != 'ok':
+            raise RuntimeError(f'Render worker error: {result}')
+        return result
+
+class RemoteSimulator:
+    """Stand-in for a simulator that lives in a render worker process"""
+    def __init__(self, worker, key, width, height):
+        self.worker = worker
+        self.key = key
+        self.width = width
+        self.height = height
+        self.memory = 0  # Reported by the worker with each frame
+    
+    def apply_params(self, params):
+        self.worker.call('params', self.key, params)
+    
+    def frame(self, dt=0.033, params=None, stream=False):
+        body, mimetype, etag, encode_ms, self.memory = self.worker.call('frame', self.key, (dt, params, stream))
+        return body, mimetype, etag, encode_ms
+    
+    def delta_frame(self, base_seq, dt=0.033, params=None):
+        result, self.memory = self.worker.call('delta', self.key, (base_seq, dt, params))
+        return result
+    
+    def scene(self, params=None):
+        ops, etag, self.memory = self.worker.call('scene', self.key, params)
+        return ops, etag
+    
+    def close(self):
+        try:
+            self.worker.call('stop', self.key)
+        except RenderWorkerLost:
+            pass  # Nothing left to stop
+        except Exception as e:
+            print(f"⚠️ Failed to stop remote simulator {self.key}: {e}")
+
+class RenderPool:
+    """Fixed set of render workers; sessions are sharded across them by session id.
+
+    A worker that has died is replaced when a new session is assigned to it. Its
+    old sessions are lost: their next request gets RenderWorkerLost.
+    """
+    def __init__(self, size):
+        self.ctx = multiprocessing.get_context('spawn')
+        self.workers = [RenderWorker(self.ctx, i) for i in range(size)]
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+    
+    def worker_for(self, session_id):
+        index = zlib.crc32(str(session_id).encode('utf-8')) % len(self.workers)
+        with self.lock:
+            worker = self.workers[index]
+            if not worker.alive():
+                print(f"⚠️ Render worker {index} exited, starting a replacement")
+                worker.lost = True
+                worker = self.workers[index] = RenderWorker(self.ctx, index)
+        return worker
+    
+    def start(self, session_id, simulator_id, settings):
+        """Create a simulator in the session's worker and return its proxy"""
+        worker = self.worker_for(session_id)
+        # Unique key so a restarted session id never collides with the one it replaces
+        key = f'{session_id}#{next(self.counter)}'
+        width, height = worker.call('start', key, (simulator_id, settings))
+        return RemoteSimulator(worker, key, width, height)
+
+render_pool = None
+render_pool_lock = threading.Lock()
+
+def create_simulator(session_id, simulator_id, settings):
+    """Construct a simulator in-process, or in its render worker when RENDER_WORKERS > 0"""
+    global render_pool
+    if RENDER_WORKERS <= 0:
+        return simulator_pool.acquire(simulator_id)
+    with render_pool_lock:
+        if render_pool is None:
+            render_pool = RenderPool(RENDER_WORKERS)
+            print(f"Started {RENDER_WORKERS} render worker processes")
+    return render_pool.start(session_id, simulator_id, settings)
+
+@app.errorhandler(RenderWorkerLost)
+def render_worker_lost(e):
+    """Drop a session whose render worker died; like an evicted session it gets 404"""
+    if e.session is None:
+        # A worker died while starting a simulator; a retry gets its replacement
+        return jsonify({'error': 'Render worker unavailable'}), 503
+    active_simulators.discard(e.session)
+    return jsonify({'error': 'Simulator lost (render worker exited)'}), 404
+
+# ==================== API Routes ====================
+
+@app.route('/api/physics/simulators', methods=['GET'])
+def list_simulators():
+    """List available physics simulators"""
+    return jsonify({
+        'simulators': [
+            {'id': 'projectile', 'name': 'Projectile Motion', 'description': 'Gesture-controlled projectile simulation'},
+            {'id': 'optics', 'name': 'Optics Simulator', 'description': 'Lens and mirror ray tracing'},
+            {'id': 'wave', 'name': 'Wave Interference', 'description': 'Wave interference patterns'},
+            {'id': 'rotational', 'name': 'Rotational Motion', 'description': 'Circular motion visualization'}
+        ]
+    })
+
+@app.route('/api/maths/simulators', methods=['GET'])
+def list_maths_simulators():
+    """List available mathematics simulators"""
+    return jsonify({
+        'simulators': [
+            {'id': 'trig', 'name': 'Trigonometric Visualizer', 'description': 'Interactive trigonometric graph with angle marker'}
+        ]
+    })
+
+@app.route('/api/physics/simulator/<simulator_id>/start', methods=['POST'])
+def start_simulator(simulator_id):
+    """Start a simulator instance"""
+    session_id = request.json.get('session_id', f'session_{int(time.time())}')
+    
+    if simulator_id not in PHYSICS_SIMULATORS:
+        return jsonify({'error': 'Unknown simulator'}), 400
+    settings = parse_frame_settings(request.json, simulator_id)
+    sim = create_simulator(session_id, simulator_id, settings)
+    active_simulators.start(session_id, simulator_id, sim, settings)
+    
+    # Clients send the affinity key back (X-Session-Affinity header or ?affinity=)
+    # so a front proxy can route every later request to this process
+    resp = jsonify({'session_id': session_id, 'status': 'started', 'affinity': INSTANCE_ID,
+                    'render_mode': settings['render_mode']})
+    resp.headers['X-Session-Affinity'] = INSTANCE_ID
+    return resp
+
+@app.route('/api/maths/simulator/<simulator_id>/start', methods=['POST'])
+def start_maths_simulator(simulator_id):
+    """Start a mathematics simulator instance"""
+    session_id = request.json.get('session_id', f'session_{int(time.time())}')
+    
+    if simulator_id not in MATHS_SIMULATORS:
+        return jsonify({'error': 'Unknown simulator'}), 400
+    settings = parse_frame_settings(request.json, simulator_id)
+    sim = create_simulator(session_id, simulator_id, settings)
+    active_simulators.start(session_id, simulator_id, sim, settings)
+    
+    # Clients send the affinity key back (X-Session-Affinity header or ?affinity=)
+    # so a front proxy can route every later request to this process
+    resp = jsonify({'session_id': session_id, 'status': 'started', 'affinity': INSTANCE_ID,
+                    'render_mode': settings['render_mode']})
+    resp.headers['X-Session-Affinity'] = INSTANCE_ID
+    return resp
+
+@app.route('/api/physics/simulator/<simulator_id>/update', methods=['POST'])
+def update_simulator(simulator_id):
+    """Update simulator state and get frame"""
+    session_id = request.json.get('session_id')
+    params = request.json.get('params', {})
+    
+    session = active_simulators.get(session_id)
+    if session is None:
+        return session_not_found(session_id)
+    
+    with session.lock:
+        return frame_response(session, params, delta=bool(request.json.get('delta')),
+                              base_seq=request.json.get('base_seq'))
+
+@app.route('/api/physics/simulator/<simulator_id>/stream', methods=['GET'])
+def stream_simulator(simulator_id):
+    """Push simulator frames as a multipart/x-mixed-replace (MJPEG) stream"""
+    session_id = request.args.get('session_id')
+    
+    if session_id not in active_simulators:
+        return session_not_found(session_id)
+    
+    try:
+        fps = float(request.args.get('fps', STREAM_DEFAULT_FPS))
+    except ValueError:
+        fps = STREAM_DEFAULT_FPS
+    fps = max(1.0, min(STREAM_MAX_FPS, fps))
+    
+    if not stream_slots.acquire(blocking=False):
+        resp = jsonify({'error': 'Too many open streams, poll /update instead'})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = '30'
+        return resp
+    resp = Response(mjpeg_stream(session_id, fps),
+                    mimetype=f'multipart/x-mixed-replace; boundary={STREAM_BOUNDARY}')
+    resp.headers['Cache-Control'] = 'no-store'
+    # Runs when the server closes the response, including client disconnects
+    resp.call_on_close(stream_slots.release)
+    return resp
+
+@app.route('/api/physics/simulator/<simulator_id>/params', methods=['POST'])
+def update_simulator_params(simulator_id):
+    """Apply parameter changes without rendering a frame (used with /stream)"""
+    session_id = request.json.get('session_id')
+    params = request.json.get('params', {})
+    
+    session = active_simulators.get(session_id)
+    if session is None:
+        return session_not_found(session_id)
+    
+    with session.lock:
+        if session.closed:
+            return session_not_found(session_id)
+        session.apply_params(params)
+    return jsonify({'status': 'ok'})
+
+@app.route('/api/maths/simulator/<simulator_id>/update', methods=['POST'])
+def update_maths_simulator(simulator_id):
+    """Update mathematics simulator state and get frame"""
+    session_id = request.json.get('session_id')
+    params = request.json.get('params', {})
+    
+    session = active_simulators.get(session_id)
+    if session is None:
+        return session_not_found(session_id)
+    
+    with session.lock:
+        return frame_response(session, params, delta=bool(request.json.get('delta')),
+                              base_seq=request.json.get('base_seq'))
 
 @app.route('/api/physics/simulator/<simulator_id>/stop', methods=['POST'])
 def stop_simulator(simulator_id):
     """Stop a simulator instance"""
     session_id = request.json.get('session_id')
     
-    with simulator_lock:
-        if session_id in active_simulators:
-            del active_simulators[session_id]
-            return jsonify({'status': 'stopped'})
-        else:
-            return jsonify({'error': 'Simulator not found'}), 404
+    if active_simulators.stop(session_id):
+        return jsonify({'status': 'stopped'})
+    return session_not_found(session_id)
 
 @app.route('/api/maths/simulator/<simulator_id>/stop', methods=['POST'])
 def stop_maths_simulator(simulator_id):
     """Stop a mathematics simulator instance"""
     session_id = request.json.get('session_id')
     
-    with simulator_lock:
-        if session_id in active_simulators:
-            del active_simulators[session_id]
-            return jsonify({'status': 'stopped'})
+    if active_simulators.stop(session_id):
+        return jsonify({'status': 'stopped'})
+    return session_not_found(session_id)
+
+def batch_number(value):
+    """A batch request number as float; JSON true/false are not numbers"""
+    if isinstance(value, bool):
+        raise ValueError(f'{value} is not a number')
+    return float(value)
+
+def parse_gravity(value):
+    """Gravity as m/s^2 from a number or a GRAVITY_MODES name"""
+    if isinstance(value, str):
+        if value not in GRAVITY_MODES:
+            raise ValueError(f'Unknown gravity mode {value!r}')
+        return GRAVITY_MODES[value]
+    g = batch_number(value)
+    if not (0 < g < math.inf):
+        raise ValueError('Gravity must be positive and finite')
+    return g
+
+@app.route('/api/physics/projectile/batch', methods=['POST'])
+def projectile_batch_route():
+    """Compute many projectile launches in one vectorized pass.
+
+    Body: {"launches": [[v, angle, g], ...]} or
+          {"sweep": {"velocities": [...], "angles": [...], "gravities": [...]}} (every combination),
+    plus optional "height" (m) and "samples" (path points per launch, 0 = no paths).
+    g / gravities may be numbers or one of GRAVITY_MODES.
+    """
+    data = request.json or {}
+    try:
+        # Sizes are checked on the raw lists, before anything is expanded
+        if 'sweep' in data:
+            sweep = data['sweep']
+            axes = [sweep['velocities'], sweep['angles'], sweep.get('gravities', ['Earth'])]
+            if not all(isinstance(axis, list) for axis in axes):
+                raise TypeError('sweep values must be lists')
+            if math.prod(len(axis) for axis in axes) > BATCH_MAX_LAUNCHES:
+                return jsonify({'error': f'At most {BATCH_MAX_LAUNCHES} launches per batch'}), 400
+            velocities, angles, gravities = axes
+            gravities = [parse_gravity(g) for g in gravities]
+            v, angle, g = (a.ravel() for a in np.meshgrid(
+                np.array([batch_number(x) for x in velocities]),
+                np.array([batch_number(x) for x in angles]),
+                np.array(gravities, dtype=np.float64), indexing='ij'))
         else:
-            return jsonify({'error': 'Simulator not found'}), 404
+            launches = data['launches']
+            if not isinstance(launches, list):
+                raise TypeError('launches must be a list')
+            if len(launches) > BATCH_MAX_LAUNCHES:
+                return jsonify({'error': f'At most {BATCH_MAX_LAUNCHES} launches per batch'}), 400
+            v = np.array([batch_number(l[0]) for l in launches])
+            angle = np.array([batch_number(l[1]) for l in launches])
+            g = np.array([parse_gravity(l[2] if len(l) > 2 else 'Earth') for l in launches])
+        height = max(0.0, batch_number(data.get('height', 0.0)))
+        samples = max(0, int(batch_number(data.get('samples', 0))))
+        if not (np.isfinite(v).all() and np.isfinite(angle).all() and math.isfinite(height)):
+            raise ValueError('velocities, angles and height must be finite')
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return jsonify({'error': f'Invalid batch request: {e}'}), 400
+    
+    if len(v) * samples > BATCH_MAX_PATH_POINTS:
+        return jsonify({'error': f'At most {BATCH_MAX_PATH_POINTS} path points per batch'}), 400
+    
+    # Finite but huge inputs can still overflow
+    with np.errstate(all='ignore'):
+        result = projectile_batch(v, angle, g, height=height, samples=samples)
+    if not all(np.isfinite(values).all() for values in result.values()):
+        return jsonify({'error': 'Invalid batch request: values out of range'}), 400
+    response = {
+        'count': int(len(v)),
+        'launches': np.column_stack((v, angle, g)).round(4).tolist(),
+    }
+    for key in ('flight_time', 'range', 'apex_height', 'apex_time'):
+        response[key] = result[key].round(4).tolist()
+    if samples > 0:
+        response['paths'] = {'x': result['x'].round(3).tolist(), 'y': result['y'].round(3).tolist()}
+    return jsonify(response)
+
+# ==================== Gesture Tracking ====================
+
+# MediaPipe Hands graphs kept alive, one per gesture session. This only bounds memory;
+# how many of them run at once is bounded by the inference workers (GESTURE_WORKERS).
+GESTURE_MAX_TRACKERS = int(os.environ.get('GESTURE_MAX_TRACKERS', 32))
+GESTURE_TRACKER_TTL = float(os.environ.get('GESTURE_TRACKER_TTL', 120))  # Idle seconds before a tracker is closed
+GESTURE_ACQUIRE_TIMEOUT = 0.5  # Seconds a request waits for a free tracker
+
+class HandTracker:
+    """One MediaPipe Hands graph in tracking (video) mode, owned by one session at a time"""
+    def __init__(self):
+        import mediapipe as mp
+        self.hands = mp.solutions.hands.Hands(
+            static_image_mode=False,
+            max_num_hands=2,
+            min_detection_confidence=0.6,
+            min_tracking_confidence=0.6
+        )
+        self.owner = None
+        self.busy = False
+        self.last_used = 0.0
+        self.roi = HandROI()
+    
+    def reset(self):
+        """Forget tracking state and the crop box, e.g. when handed to another session"""
+        self.hands.reset()
+        self.roi.reset()
+    
+    def process(self, img_rgb):
+        """Run Hands on the last hand region, falling back to the full frame on loss.
+
+        Landmarks of cropped results are mapped back to full-frame normalized
+        coordinates, so callers can't tell the two apart. The graph is reset
+        whenever its input switches between crop and full frame or the crop moves.
+        """
+        return self.roi.process(self.hands.process, img_rgb, reset_graph=self.hands.reset)
+
+class HandTrackerPool:
+    """Per-session hand trackers, at most GESTURE_MAX_TRACKERS of them.
+
+    A session keeps the same tracker, and so its own tracking state, across calls.
+    Trackers idle for GESTURE_TRACKER_TTL are closed. Only when the cap is reached
+    is the least recently used idle tracker reset and handed to a new session.
+    New graphs are built outside the lock, so slow construction doesn't hold up
+    requests for other sessions.
+    """
+    def __init__(self, size=GESTURE_MAX_TRACKERS, ttl=GESTURE_TRACKER_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.trackers = {}  # session id -> HandTracker, or None while one is being built
+        self.cond = threading.Condition()
+    
+    def expire(self):
+        """Unregister trackers idle past the TTL and return them for closing (caller holds cond)"""
+        cutoff = time.time() - self.ttl
+        expired = [sid for sid, t in self.trackers.items()
+                   if t is not None and not t.busy and t.last_used < cutoff]
+        return [self.trackers.pop(sid) for sid in expired]
+    
+    def acquire(self, session_id, timeout=GESTURE_ACQUIRE_TIMEOUT):
+        """Check out session_id's tracker; None if none became free within timeout"""
+        deadline = time.time() + timeout
+        tracker = None
+        build = handover = False
+        with self.cond:
+            expired = self.expire()
+            while True:
+                if session_id in self.trackers:
+                    tracker = self.trackers[session_id]
+                    if tracker is not None and not tracker.busy:
+                        break
+                elif len(self.trackers) < self.size:
+                    # Reserve the slot; the graph is built below, outside the lock
+                    self.trackers[session_id] = None
+                    build = True
+                    break
+                else:
+                    idle = [t for t in self.trackers.values() if t is not None and not t.busy]
+                    if idle:
+                        tracker = min(idle, key=lambda t: t.last_used)
+                        del self.trackers[tracker.owner]
+                        self.trackers[session_id] = tracker
+                        handover = True
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    tracker = None
+                    break
+                self.cond.wait(remaining)
+            if tracker is not None and not build:
+                tracker.busy = True
+                tracker.last_used = time.time()
+                tracker.owner = session_id
+        for old in expired:
+            old.hands.close()
+        if build:
+            try:
+                tracker = HandTracker()
+            except Exception:
+                with self.cond:
+                    del self.trackers[session_id]
+                    self.cond.notify_all()
+                raise
+            tracker.busy = True
+            tracker.last_used = time.time()
+            tracker.owner = session_id
+            with self.cond:
+                self.trackers[session_id] = tracker
+        elif handover:
+            # Drop the previous owner's tracking state
+            tracker.reset()
+        return tracker
+    
+    def release(self, tracker):
+        with self.cond:
+            tracker.busy = False
+            tracker.last_used = time.time()
+            self.cond.notify_all()
+    
+    def stats(self):
+        with self.cond:
+            trackers = [t for t in self.trackers.values() if t is not None]
+            return {'trackers': len(self.trackers),
+                    'busy': sum(1 for t in trackers if t.busy)}
+
+hand_trackers = HandTrackerPool()
+
+# Frame size clients should send (enough for MediaPipe Hands); larger frames are downscaled to it
+GESTURE_INPUT_SIZE = (256, 192)
+GESTURE_MAX_INPUT_SIDE = 320
+GESTURE_RAW_CHANNELS = {'gray': 1, 'rgb': 3, 'rgba': 4}
+
+def request_flag(value, default=False):
+    """Boolean option from JSON (true/false/1/0) or query text ('1', 'true', 'yes')"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+def read_gesture_frame():
+    """Decode the request's frame as an RGB array, returns (rgb or None, options).
+
+    Accepts a JSON body {"image": base64 JPEG, ...}, a raw image/jpeg body, or an
+    application/octet-stream buffer of ?width x ?height pixels in ?format (gray,
+    rgb or rgba). For binary bodies the options (session_id, return_annotated)
+    come from the query string. rgb is None when no image was sent; a malformed
+    one raises ValueError with a message for the client.
+    """
+    if request.is_json:
+        options = request.json or {}
+        image_base64 = options.get('image')
+        if not image_base64:
+            return None, options
+        try:
+            image_data = base64.b64decode(image_base64, validate=True)
+        except (TypeError, ValueError):
+            raise ValueError('image is not valid base64')
+        img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        options = {
+            'session_id': request.args.get('session_id'),
+            'return_annotated': request.args.get('return_annotated'),
+        }
+        body = request.get_data()
+        if not body:
+            return None, options
+        if request.mimetype == 'application/octet-stream':
+            channels = GESTURE_RAW_CHANNELS.get(request.args.get('format', 'rgb'))
+            width = request.args.get('width', type=int)
+            height = request.args.get('height', type=int)
+            if channels is None:
+                raise ValueError('format must be gray, rgb or rgba')
+            if width is None or height is None or width <= 0 or height <= 0:
+                raise ValueError('width and height must be positive integers')
+            if len(body) != width * height * channels:
+                raise ValueError(f'expected {width * height * channels} bytes for '
+                                 f'{width}x{height} {request.args.get("format", "rgb")}, got {len(body)}')
+            pixels = np.frombuffer(body, np.uint8).reshape(height, width, channels)
+            if channels == 1:
+                rgb = cv2.cvtColor(pixels, cv2.COLOR_GRAY2RGB)
+            elif channels == 4:
+                rgb = cv2.cvtColor(pixels, cv2.COLOR_RGBA2RGB)
+            else:
+                rgb = pixels.copy()
+            return fit_gesture_frame(rgb), options
+        img = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+    
+    if img is None:
+        raise ValueError('image could not be decoded')
+    return fit_gesture_frame(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)), options
+
+def fit_gesture_frame(rgb):
+    """Downscale oversized frames to GESTURE_INPUT_SIZE; small frames pass through untouched"""
+    if max(rgb.shape[:2]) <= GESTURE_MAX_INPUT_SIDE:
+        return rgb
+    h, w = rgb.shape[:2]
+    scale = min(GESTURE_INPUT_SIZE[0] / w, GESTURE_INPUT_SIZE[1] / h)
+    return cv2.resize(rgb, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+def hand_measurements(results, img_w, img_h):
+    """Label, score, flattened landmarks and thumb-index distance for each detected hand"""
+    hands = []
+    if not (results.multi_hand_landmarks and results.multi_handedness):
+        return hands
+    img_diag = math.sqrt(img_w*img_w + img_h*img_h)
+    for hand_landmarks, handedness in zip(results.multi_hand_landmarks, results.multi_handedness):
+        lm = hand_landmarks.landmark
+        thumb_tip = lm[4]
+        index_tip = lm[8]
+        
+        # Distance between thumb tip (4) and index tip (8), normalized by image diagonal
+        dx = (index_tip.x - thumb_tip.x) * img_w
+        dy = (index_tip.y - thumb_tip.y) * img_h
+        dist_px = math.sqrt(dx*dx + dy*dy)
+        hands.append({
+            'label': handedness.classification[0].label,
+            'score': float(handedness.classification[0].score),
+            'dist': dist_px / img_diag if img_diag > 0 else 0,
+            'points': [round(v, 4) for p in lm for v in (p.x, p.y)],
+            'landmarks': hand_landmarks,
+        })
+    return hands
+
+def annotate_hands(img, results, hands, mp_hands, mp_drawing):
+    """Copy of img with landmarks, connections and the thumb-index pinch line drawn"""
+    annotated_img = img.copy()
+    img_h, img_w = annotated_img.shape[:2]
+    for hand in hands:
+        # Draw hand landmarks and connections
+        mp_drawing.draw_landmarks(
+            annotated_img,
+            hand['landmarks'],
+            mp_hands.HAND_CONNECTIONS,
+            mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
+            mp_drawing.DrawingSpec(color=(255, 0, 0), thickness=2)
+        )
+        
+        # Draw line between thumb and index finger tips
+        lm = hand['landmarks'].landmark
+        x1, y1 = int(lm[4].x * img_w), int(lm[4].y * img_h)
+        x2, y2 = int(lm[8].x * img_w), int(lm[8].y * img_h)
+        cv2.line(annotated_img, (x1, y1), (x2, y2), (200, 200, 0), 2)
+        mid = ((x1+x2)//2, (y1+y2)//2)
+        cv2.circle(annotated_img, mid, 6, (255, 180, 0), -1)
+    return annotated_img
+
+@app.route('/api/physics/gesture/config', methods=['GET'])
+def gesture_config():
+    """Frame size and raw formats the gesture endpoint expects, plus a fresh client id"""
+    return jsonify({
+        'client_id': uuid.uuid4().hex,
+        'input_size': list(GESTURE_INPUT_SIZE),
+        'raw_formats': list(GESTURE_RAW_CHANNELS)
+    })
+
+def gesture_result(error=None):
+    """Response for a frame with no hands measured"""
+    result = {
+        'left_dist': None,
+        'right_dist': None,
+        'pinch': False,
+        'hands_detected': False,
+        'annotated_frame': None
+    }
+    if error:
+        result['error'] = error
+    return result
+
+def infer_gesture(session_id, img_rgb, return_annotated):
+    """Run session_id's hand tracker on one RGB frame and build the gesture response"""
+    try:
+        import mediapipe as mp
+    except ImportError:
+        # MediaPipe not available, return without landmarks
+        return gesture_result('MediaPipe not available')
+    mp_hands = mp.solutions.hands
+    mp_drawing = mp.solutions.drawing_utils
+    
+    # Per-session tracker, so tracking state never mixes between users
+    tracker = hand_trackers.acquire(session_id)
+    if tracker is None:
+        return gesture_result('Gesture trackers busy')
+    img_rgb.flags.writeable = False
+    try:
+        results = tracker.process(img_rgb)
+    finally:
+        hand_trackers.release(tracker)
+    img_rgb.flags.writeable = True
+    
+    hands = hand_measurements(results, img_rgb.shape[1], img_rgb.shape[0])
+    left_dist = None
+    right_dist = None
+    for hand in hands:
+        # Note: MediaPipe's "Left" means left hand from user's perspective
+        if hand['label'] == "Left":
+            left_dist = hand['dist']
+        else:
+            right_dist = hand['dist']
+    
+    # Pinch detection (right hand distance < threshold)
+    pinch = False
+    if right_dist is not None and right_dist < 0.15:
+        pinch = True
+    
+    response = {
+        'left_dist': left_dist,
+        'right_dist': right_dist,
+        'pinch': pinch,
+        'hands_detected': bool(hands),
+        # Normalized [x0, y0, x1, y1, ...] for the 21 landmarks, for client-side overlays
+        'hands': [{'label': hand['label'], 'score': round(hand['score'], 3),
+                   'dist': hand['dist'], 'landmarks': hand['points']} for hand in hands],
+        'annotated_frame': None
+    }
+    if return_annotated:
+        img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
+        annotated_img = annotate_hands(img, results, hands, mp_hands, mp_drawing)
+        # Encode annotated frame to base64
+        _, buffer = cv2.imencode('.jpg', annotated_img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+        response['annotated_frame'] = f'data:image/jpeg;base64,{annotated_base64}'
+    return response
+
+# Threads running hand inference; request threads only hand frames over and wait
+GESTURE_WORKERS = int(os.environ.get('GESTURE_WORKERS', 4))
+GESTURE_RESULT_TIMEOUT = 1.0  # Seconds a request waits for its frame's result
+GESTURE_MAILBOX_TTL = 60  # Seconds before an idle session's mailbox is dropped
+
+class GestureMailbox:
+    """One session's single pending frame and its most recent result"""
+    def __init__(self):
+        self.frame = None  # (seq, img_rgb, return_annotated) not yet picked up by a worker
+        self.seq = 0  # Sequence number of the last submitted frame
+        self.running_seq = 0  # Frame a worker is processing now
+        self.result = None
+        self.result_seq = 0
+        self.scheduled = False  # Queued for, or being processed by, a worker
+        self.last_used = time.time()
+
+class GestureInferencePool:
+    """Inference threads fed from one-slot mailboxes, latest frame wins.
+
+    A frame arriving while the session's previous one is still unprocessed
+    replaces it, and the request that sent the dropped frame returns the
+    session's latest result straight away. A session is handled by one worker
+    at a time, so its tracker sees frames in order, and work under overload is
+    bounded by the number of sessions rather than the number of requests.
+    """
+    def __init__(self, workers=GESTURE_WORKERS):
+        self.workers = workers
+        self.threads = []
+        self.mailboxes = {}
+        self.ready = deque()  # Session ids waiting for a worker
+        self.dropped = 0
+        self.cond = threading.Condition()
+    
+    def submit(self, session_id, img_rgb, return_annotated, timeout=GESTURE_RESULT_TIMEOUT):
+        """Post a frame; returns (freshest result or None, whether it is this frame's).
+
+        session_id must identify one client: requests sharing it drop each other's
+        frames and get each other's results, so there is no shared fallback key.
+        """
+        if not session_id:
+            raise ValueError('Gesture frames need a session_id')
+        deadline = time.time() + timeout
+        with self.cond:
+            if not self.threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.run, name=f'gesture-{i}', daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            self.expire()
+            box = self.mailboxes.get(session_id)
+            if box is None:
+                box = self.mailboxes[session_id] = GestureMailbox()
+            if box.frame is not None:
+                # Wakes the request that sent the replaced frame
+                self.dropped += 1
+                self.cond.notify_all()
+            box.seq += 1
+            seq = box.seq
+            box.frame = (seq, img_rgb, return_annotated)
+            box.last_used = time.time()
+            if not box.scheduled:
+                box.scheduled = True
+                self.ready.append(session_id)
+                self.cond.notify_all()
+            # Stop waiting once a newer frame has replaced this one
+            while box.result_seq < seq and (box.running_seq == seq or
+                                            (box.frame is not None and box.frame[0] == seq)):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return box.result, box.result_seq >= seq
+    
+    def expire(self):
+        """Forget idle sessions' mailboxes (caller holds cond)"""
+        cutoff = time.time() - GESTURE_MAILBOX_TTL
+        for session_id in [sid for sid, box in self.mailboxes.items()
+                           if box.last_used < cutoff and not box.scheduled]:
+            del self.mailboxes[session_id]
+    
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.ready:
+                    self.cond.wait()
+                session_id = self.ready.popleft()
+                box = self.mailboxes[session_id]
+                seq, img_rgb, return_annotated = box.frame
+                box.frame = None
+                box.running_seq = seq
+            try:
+                result = infer_gesture(session_id, img_rgb, return_annotated)
+            except Exception as e:
+                print(f"Gesture processing error: {e}")
+                result = gesture_result(str(e))
+            with self.cond:
+                box.result, box.result_seq = result, seq
+                if box.frame is not None:
+                    self.ready.append(session_id)
+                else:
+                    box.scheduled = False
+                self.cond.notify_all()
+    
+    def stats(self):
+        with self.cond:
+            return {'workers': len(self.threads),
+                    'sessions': len(self.mailboxes),
+                    'queued': len(self.ready),
+                    'dropped_frames': self.dropped}
+
+gesture_inference = GestureInferencePool()
 
 @app.route('/api/physics/gesture/process', methods=['POST'])
 def process_gesture():
     """Process gesture data from frontend image with MediaPipe hand detection"""
     try:
-        data = request.json
-        image_base64 = data.get('image')
-        
-        if not image_base64:
-            return jsonify({
-                'left_dist': None,
-                'right_dist': None,
-                'pinch': False,
-                'hands_detected': False,
-                'annotated_frame': None
-            })
-        
-        # Decode base64 image
-        import base64
-        image_data = base64.b64decode(image_base64)
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return jsonify({
-                'left_dist': None,
-                'right_dist': None,
-                'pinch': False,
-                'hands_detected': False,
-                'annotated_frame': None
-            })
-        
-        # Convert BGR to RGB for MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img_rgb.flags.writeable = False
-        
-        # Process with MediaPipe Hands
         try:
-            import mediapipe as mp
-            mp_hands = mp.solutions.hands
-            mp_drawing = mp.solutions.drawing_utils
-            
-            # Initialize MediaPipe Hands if not already done
-            if not hasattr(process_gesture, 'hands'):
-                process_gesture.hands = mp_hands.Hands(
-                    static_image_mode=False,
-                    max_num_hands=2,
-                    min_detection_confidence=0.6,
-                    min_tracking_confidence=0.6
-                )
-            
-            results = process_gesture.hands.process(img_rgb)
-            img_rgb.flags.writeable = True
-            
-            # Draw landmarks on the image
-            annotated_img = img.copy()
-            left_dist = None
-            right_dist = None
-            hands_detected = False
-            
-            if results.multi_hand_landmarks and results.multi_handedness:
-                hands_detected = True
-                img_h, img_w = annotated_img.shape[:2]
-                
-                for hand_landmarks, handedness in zip(results.multi_hand_landmarks, results.multi_handedness):
-                    # Draw hand landmarks and connections
-                    mp_drawing.draw_landmarks(
-                        annotated_img,
-                        hand_landmarks,
-                        mp_hands.HAND_CONNECTIONS,
-                        mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-                        mp_drawing.DrawingSpec(color=(255, 0, 0), thickness=2)
-                    )
-                    
-                    # Get hand label (Left or Right from camera perspective)
-                    label = handedness.classification[0].label
-                    
-                    # Calculate normalized distance between thumb tip (4) and index tip (8)
-                    lm = hand_landmarks.landmark
-                    thumb_tip = lm[4]
-                    index_tip = lm[8]
-                    
-                    # Calculate distance in normalized coordinates
-                    dx = (index_tip.x - thumb_tip.x) * img_w
-                    dy = (index_tip.y - thumb_tip.y) * img_h
-                    dist_px = math.sqrt(dx*dx + dy*dy)
-                    # Normalize by image diagonal
-                    img_diag = math.sqrt(img_w*img_w + img_h*img_h)
-                    normalized_dist = dist_px / img_diag if img_diag > 0 else 0
-                    
-                    # Draw line between thumb and index finger tips
-                    x1, y1 = int(thumb_tip.x * img_w), int(thumb_tip.y * img_h)
-                    x2, y2 = int(index_tip.x * img_w), int(index_tip.y * img_h)
-                    cv2.line(annotated_img, (x1, y1), (x2, y2), (200, 200, 0), 2)
-                    mid = ((x1+x2)//2, (y1+y2)//2)
-                    cv2.circle(annotated_img, mid, 6, (255, 180, 0), -1)
-                    
-                    # Assign to left or right hand
-                    # Note: MediaPipe's "Left" means left hand from user's perspective
-                    if label == "Left":
-                        left_dist = normalized_dist
-                    else:
-                        right_dist = normalized_dist
-            
-            # Pinch detection (right hand distance < threshold)
-            pinch = False
-            if right_dist is not None and right_dist < 0.15:
-                pinch = True
-            
-            # Encode annotated frame to base64
-            _, buffer = cv2.imencode('.jpg', annotated_img, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            annotated_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            return jsonify({
-                'left_dist': left_dist,
-                'right_dist': right_dist,
-                'pinch': pinch,
-                'hands_detected': hands_detected,
-                'annotated_frame': f'data:image/jpeg;base64,{annotated_base64}'
-            })
-            
-        except ImportError:
-            # MediaPipe not available, return without landmarks
-            return jsonify({
-                'left_dist': None,
-                'right_dist': None,
-                'pinch': False,
-                'hands_detected': False,
-                'annotated_frame': None,
-                'error': 'MediaPipe not available'
-            })
+            img_rgb, data = read_gesture_frame()
+        except ValueError as e:
+            return jsonify(gesture_result(f'Invalid frame: {e}')), 400
+        
+        if img_rgb is None:
+            return jsonify(gesture_result())
+        
+        # Required: clients behind one NAT or proxy share an address, and must not
+        # share a tracker (or a mailbox)
+        session_id = data.get('session_id')
+        if not session_id:
+            return jsonify(gesture_result('session_id is required')), 400
+        result, fresh = gesture_inference.submit(session_id, img_rgb,
+                                                 request_flag(data.get('return_annotated'), True))
+        if result is None:
+            return jsonify(gesture_result('Gesture result not ready'))
+        # stale: this frame was dropped or timed out, and the result is from an earlier one
+        return jsonify(dict(result, stale=not fresh))
             
     except Exception as e:
         print(f"Gesture processing error: {e}")
-        return jsonify({
-            'left_dist': None,
-            'right_dist': None,
-            'pinch': False,
-            'hands_detected': False,
-            'annotated_frame': None,
-            'error': str(e)
-        })
+        return jsonify(gesture_result(str(e)))
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'ok', 'active_simulators': len(active_simulators)})
+    return jsonify({
+        'status': 'ok',
+        'instance': INSTANCE_ID,
+        'active_simulators': len(active_simulators),
+        'registered_sessions': active_simulators.store.count(),
+        'pooled_simulators': simulator_pool.idle_count(),
+        'gesture_trackers': hand_trackers.stats(),
+        'gesture_inference': gesture_inference.stats(),
+        'simulator_memory_mb': round(active_simulators.memory_usage() / (1024 * 1024), 1)
+    })
+
+# ==================== WebSocket Transport ====================
+
+# Optional: bidirectional simulator channel (requires the `websockets` package).
+# Runs on its own port beside the WSGI server, since Waitress can't upgrade connections.
+try:
+    from websockets.sync.server import serve as ws_serve
+    from websockets.exceptions import ConnectionClosed
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+WS_PORT = int(os.environ.get('WS_PORT', 5001))
+WS_MAX_IN_FLIGHT = 2  # Unacknowledged frames allowed before the server stops rendering
+
+def ws_frame_producer(ws, session_id, fps, state):
+    """Render and send frames at the target rate, skipping frames while the client is behind.
+
+    Each binary message is a 4-byte big-endian sequence number followed by the
+    encoded image. Clients acknowledge with {"ack": seq} after drawing a frame.
+    """
+    interval = 1.0 / fps
+    seq = 0
+    last_render = time.time()
+    next_frame = last_render
+    while not state['closed']:
+        session = active_simulators.get(session_id)
+        if session is None:
+            ws.close(1000, 'Simulator stopped')
+            break
+        
+        # Backpressure: only render when the client has caught up
+        if seq - state['acked'] < WS_MAX_IN_FLIGHT:
+            now = time.time()
+            dt = min(0.1, now - last_render)
+            last_render = now
+            try:
+                with session.lock:
+                    if session.closed:
+                        ws.close(1000, 'Simulator stopped')
+                        break
+                    body, _, _, _ = session.frame(dt=dt)
+            except RenderWorkerLost:
+                active_simulators.discard(session)
+                ws.close(1011, 'Simulator lost')
+                break
+            seq += 1
+            try:
+                ws.send(struct.pack('>I', seq) + body)
+            except ConnectionClosed:
+                break
+        else:
+            state['dropped'] += 1
+        
+        next_frame += interval
+        delay = next_frame - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.time()
+
+def ws_simulator_handler(ws):
+    """Handle ws://host:5001/simulator/<simulator_id>?session_id=<id>&fps=20
+
+    Client text messages are JSON: {"params": {...}} applies parameter deltas,
+    {"ack": seq} acknowledges a received frame.
+    """
+    url = urlparse(ws.request.path)
+    parts = url.path.strip('/').split('/')
+    query = parse_qs(url.query)
+    session_id = query.get('session_id', [None])[0]
+    
+    if len(parts) != 2 or parts[0] != 'simulator' or session_id not in active_simulators:
+        owner = active_simulators.owner(session_id)
+        if owner is not None and owner != active_simulators.instance_id:
+            ws.close(1008, f'Session owned by {owner}')
+        else:
+            ws.close(1008, 'Simulator not found')
+        return
+    
+    try:
+        fps = float(query.get('fps', [STREAM_DEFAULT_FPS])[0])
+    except ValueError:
+        fps = STREAM_DEFAULT_FPS
+    fps = max(1.0, min(STREAM_MAX_FPS, fps))
+    
+    state = {'acked': 0, 'dropped': 0, 'closed': False}
+    producer = threading.Thread(target=ws_frame_producer,
+                                args=(ws, session_id, fps, state), daemon=True)
+    producer.start()
+    
+    try:
+        for message in ws:
+            try:
+                msg = json.loads(message)
+            except (TypeError, ValueError):
+                continue
+            if 'ack' in msg:
+                state['acked'] = max(state['acked'], int(msg['ack']))
+            if 'params' in msg:
+                session = active_simulators.get(session_id)
+                if session is not None:
+                    try:
+                        with session.lock:
+                            if not session.closed:
+                                session.apply_params(msg['params'])
+                    except RenderWorkerLost:
+                        # The producer sees the session gone and closes the socket
+                        active_simulators.discard(session)
+    except ConnectionClosed:
+        pass
+    finally:
+        state['closed'] = True
+        producer.join(timeout=1.0)
+
+def start_websocket_server(host='0.0.0.0', port=WS_PORT):
+    """Start the WebSocket server in a background thread (no-op if websockets is missing)"""
+    if not WEBSOCKET_AVAILABLE:
+        print("⚠️ websockets not installed; WebSocket transport disabled")
+        return None
+    server = ws_serve(ws_simulator_handler, host, port)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    print(f"WebSocket transport available at ws://localhost:{port}/simulator/<simulator_id>")
+    return server
 
 # ==================== Text to Animation API (using tta.py) ====================
 
@@ -934,64 +2842,65 @@ text_to_speech = None
 generate_manim_code = None
 render_video = None
 
-try:
-    # Try to import tta module
-    import importlib.util
-    # Get the correct path to tta.py
-    backend_dir = os.path.dirname(os.path.abspath(__file__))
-    tta_path = os.path.join(backend_dir, 'gesture', 'tta.py')
-    
-    # Normalize the path
-    tta_path = os.path.normpath(tta_path)
-    
-    print(f"🔍 Looking for tta.py at: {tta_path}")
-    print(f"📁 Backend directory: {backend_dir}")
-    
-    if not os.path.exists(tta_path):
-        # Try alternative path (if backend is in a subdirectory)
-        alt_path = os.path.join(backend_dir, '..', 'gesture', 'tta.py')
-        alt_path = os.path.normpath(os.path.abspath(alt_path))
-        print(f"🔍 Trying alternative path: {alt_path}")
-        if os.path.exists(alt_path):
-            tta_path = alt_path
-    
-    if os.path.exists(tta_path):
-        print(f"✅ Found tta.py at: {tta_path}")
-        # Import tta.py directly as a module (it already has the correct fallback code)
-        spec = importlib.util.spec_from_file_location("tta", tta_path)
-        tta = importlib.util.module_from_spec(spec)
+if not IS_RENDER_WORKER:
+    try:
+        # Try to import tta module
+        import importlib.util
+        # Get the correct path to tta.py
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        tta_path = os.path.join(backend_dir, 'gesture', 'tta.py')
+    
+        # Normalize the path
+        tta_path = os.path.normpath(tta_path)
+    
+        print(f"🔍 Looking for tta.py at: {tta_path}")
+        print(f"📁 Backend directory: {backend_dir}")
+    
+        if not os.path.exists(tta_path):
+            # Try alternative path (if backend is in a subdirectory)
+            alt_path = os.path.join(backend_dir, '..', 'gesture', 'tta.py')
+            alt_path = os.path.normpath(os.path.abspath(alt_path))
+            print(f"🔍 Trying alternative path: {alt_path}")
+            if os.path.exists(alt_path):
+                tta_path = alt_path
+    
+        if os.path.exists(tta_path):
+            print(f"✅ Found tta.py at: {tta_path}")
+            # Import tta.py directly as a module (it already has the correct fallback code)
+            spec = importlib.util.spec_from_file_location("tta", tta_path)
+            tta = importlib.util.module_from_spec(spec)
         
-        try:
-            spec.loader.exec_module(tta)
+            try:
+                spec.loader.exec_module(tta)
             
-            # Extract functions
-            summarize_topic = tta.summarize_topic
-            generate_questions = tta.generate_questions
-            text_to_speech = tta.text_to_speech
-            generate_manim_code = tta.generate_manim_code
-            render_video = tta.render_video  # Also get render_video function
-            TTA_AVAILABLE = True
-            print("✅ TTA module loaded successfully")
-            print(f"   - summarize_topic: {summarize_topic is not None}")
-            print(f"   - generate_questions: {generate_questions is not None}")
-            print(f"   - text_to_speech: {text_to_speech is not None}")
-            print(f"   - generate_manim_code: {generate_manim_code is not None}")
-            print(f"   - render_video: {render_video is not None}")
-        except Exception as e:
-            print(f"❌ Error loading TTA module: {e}")
-            import traceback
-            traceback.print_exc()
+                # Extract functions
+                summarize_topic = tta.summarize_topic
+                generate_questions = tta.generate_questions
+                text_to_speech = tta.text_to_speech
+                generate_manim_code = tta.generate_manim_code
+                render_video = tta.render_video  # Also get render_video function
+                TTA_AVAILABLE = True
+                print("✅ TTA module loaded successfully")
+                print(f"   - summarize_topic: {summarize_topic is not None}")
+                print(f"   - generate_questions: {generate_questions is not None}")
+                print(f"   - text_to_speech: {text_to_speech is not None}")
+                print(f"   - generate_manim_code: {generate_manim_code is not None}")
+                print(f"   - render_video: {render_video is not None}")
+            except Exception as e:
+                print(f"❌ Error loading TTA module: {e}")
+                import traceback
+                traceback.print_exc()
+                TTA_AVAILABLE = False
+        else:
+            print(f"❌ tta.py not found at {tta_path}")
+            print(f"   Current working directory: {os.getcwd()}")
+            print(f"   Backend directory: {backend_dir}")
             TTA_AVAILABLE = False
-    else:
-        print(f"❌ tta.py not found at {tta_path}")
-        print(f"   Current working directory: {os.getcwd()}")
-        print(f"   Backend directory: {backend_dir}")
+    except Exception as e:
+        print(f"❌ Failed to load tta.py: {e}")
+        import traceback
+        traceback.print_exc()
         TTA_AVAILABLE = False
-except Exception as e:
-    print(f"❌ Failed to load tta.py: {e}")
-    import traceback
-    traceback.print_exc()
-    TTA_AVAILABLE = False
 
 @app.route('/api/tta/summarize', methods=['POST'])
 def tta_summarize():
@@ -1544,15 +3453,19 @@ def tta_process():
 
 if __name__ == '__main__':
     print("Starting EduVision Physics Backend Server...")
-    print("API available at http://localhost:5000")
+    print(f"API available at http://localhost:{SERVER_PORT} (instance {INSTANCE_ID})")
+    start_websocket_server()
+    if RENDER_WORKERS <= 0:
+        simulator_pool.prewarm()
 
     # Use Waitress WSGI server on Windows to avoid werkzeug reloader/select issues.
     try:
         from waitress import serve
-        # debug=False when running under waitress; threaded handling is internal to waitress
-        serve(app, host='0.0.0.0', port=5000)
+        # debug=False when running under waitress; threaded handling is internal to waitress.
+        # Sessions render in parallel under per-session locks, and each open /stream holds a thread.
+        serve(app, host='0.0.0.0', port=SERVER_PORT, threads=WAITRESS_THREADS)
     except Exception as e:
         print("⚠️ Waitress not available or failed to start:", e)
         print("Falling back to Flask dev server (reloader disabled).")
-        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True, use_reloader=False)
+        app.run(host='0.0.0.0', port=SERVER_PORT, debug=False, threaded=True, use_reloader=False)
 
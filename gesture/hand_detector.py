@@ -1,6 +1,8 @@
 import mediapipe as mp
 import math
 
+from gesture.hand_roi import HandROI
+
 mp_hands = mp.solutions.hands
 mp_draw = mp.solutions.drawing_utils
 
@@ -12,9 +14,14 @@ class HandDetector:
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        self.roi = HandROI()
 
     def process(self, frame_rgb):
-        return self.hands.process(frame_rgb)
+        """Detect hands, searching only around the last hands when they were found confidently.
+
+        Landmarks are always normalized to the full frame.
+        """
+        return self.roi.process(self.hands.process, frame_rgb, reset_graph=self.hands.reset)
 
     def draw(self, frame, hand_landmarks):
         mp_draw.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
@@ -0,0 +1,115 @@
+"""Crop-box tracking for hand detection.
+
+After a confident frame, the next one only needs to be searched around the
+hands that were just found. This module works out that box and maps landmarks
+found in the crop back to the full frame. It only relies on the shape of
+MediaPipe Hands results (multi_hand_landmarks / multi_handedness), so it can be
+used without importing MediaPipe.
+"""
+import math
+import numpy as np
+
+MIN_SCORE = 0.8     # every hand needs this handedness score before we crop
+PADDING = 0.5       # padding on each side, as a fraction of the hand box's larger side
+MIN_SIDE = 96       # pixels; smaller crops lose landmark accuracy
+MAX_AREA = 0.6      # fraction of the frame; bigger crops save too little
+REFRESH = 30        # full-frame pass every N frames so new hands are picked up
+
+
+def next_roi(results, img_w, img_h, current=None):
+    """Padded pixel box (x0, y0, x1, y1) around all detected hands, or None for full frame.
+
+    current is kept while the hands stay well inside it, so the crop (and with it
+    MediaPipe's own tracking) doesn't jitter from frame to frame.
+    """
+    if not (results.multi_hand_landmarks and results.multi_handedness):
+        return None
+    if min(hd.classification[0].score for hd in results.multi_handedness) < MIN_SCORE:
+        return None
+    xs = [lm.x * img_w for hand in results.multi_hand_landmarks for lm in hand.landmark]
+    ys = [lm.y * img_h for hand in results.multi_hand_landmarks for lm in hand.landmark]
+    bx0, bx1, by0, by1 = min(xs), max(xs), min(ys), max(ys)
+    size = max(bx1 - bx0, by1 - by0)
+
+    if current is not None:
+        margin = size * PADDING / 2
+        x0, y0, x1, y1 = current
+        if ((bx0 - margin >= x0 or x0 == 0) and (bx1 + margin <= x1 or x1 == img_w) and
+                (by0 - margin >= y0 or y0 == 0) and (by1 + margin <= y1 or y1 == img_h)):
+            return current
+
+    half = max(size / 2 + size * PADDING, MIN_SIDE / 2)
+    cx, cy = (bx0 + bx1) / 2, (by0 + by1) / 2
+    x0, x1 = max(0, int(cx - half)), min(img_w, int(math.ceil(cx + half)))
+    y0, y1 = max(0, int(cy - half)), min(img_h, int(math.ceil(cy + half)))
+    if (x1 - x0) * (y1 - y0) > MAX_AREA * img_w * img_h:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def crop(frame, roi):
+    """Contiguous copy of the roi region of frame"""
+    x0, y0, x1, y1 = roi
+    return np.ascontiguousarray(frame[y0:y1, x0:x1])
+
+
+def to_full_frame(results, roi, img_w, img_h):
+    """Rewrite landmarks found in the roi crop as full-frame normalized coordinates, in place"""
+    x0, y0, x1, y1 = roi
+    sx, sy = (x1 - x0) / img_w, (y1 - y0) / img_h
+    for hand in results.multi_hand_landmarks:
+        for lm in hand.landmark:
+            lm.x = x0 / img_w + lm.x * sx
+            lm.y = y0 / img_h + lm.y * sy
+            lm.z *= sx
+
+
+FRESH = object()  # the graph has no tracking state yet
+
+
+class HandROI:
+    """Crop state for one video stream"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget the crop; call together with resetting the graph itself"""
+        self.roi = None
+        self.frames = 0  # consecutive cropped frames since the last full-frame pass
+        self.fed = FRESH  # box the graph last saw (None = full frame)
+
+    def detect_in(self, detect, reset_graph, frame_rgb, box):
+        """Run detect on box of frame_rgb (None = full frame).
+
+        A video-mode graph carries its tracking box over from the previous input,
+        in that input's coordinates, so it is reset whenever the input changes.
+        """
+        if reset_graph is not None and self.fed is not FRESH and box != self.fed:
+            reset_graph()
+        self.fed = box
+        return detect(frame_rgb if box is None else crop(frame_rgb, box))
+
+    def process(self, detect, frame_rgb, reset_graph=None):
+        """Run detect (e.g. Hands.process) on the crop, or the full frame on loss.
+
+        reset_graph (e.g. Hands.reset) is called whenever the input switches
+        between crop and full frame or the crop moves. Returned landmarks are
+        always normalized to the full frame.
+        """
+        img_h, img_w = frame_rgb.shape[:2]
+        results = None
+        if self.roi is not None and self.frames < REFRESH:
+            results = self.detect_in(detect, reset_graph, frame_rgb, self.roi)
+            if results.multi_hand_landmarks:
+                self.frames += 1
+                to_full_frame(results, self.roi, img_w, img_h)
+            else:
+                results = None
+        if results is None:
+            # No region yet, or the hands left it: search the whole frame
+            results = self.detect_in(detect, reset_graph, frame_rgb, None)
+            self.roi = None
+            self.frames = 0
+        self.roi = next_roi(results, img_w, img_h, self.roi)
+        return results
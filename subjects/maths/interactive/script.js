@@ -6,8 +6,22 @@
 const API_BASE = 'http://localhost:5000/api/maths';
 let currentSimulator = null;
 let currentSessionId = null;
+let sessionAffinity = null; // Server process that owns the session (multi-process deployments)
+let renderMode = 'raster'; // 'vector' when the server sends primitive lists instead of images
 let animationFrameId = null;
 
+/**
+ * JSON request headers for session calls, including the affinity key that
+ * routes the request to the server process owning the session
+ */
+function sessionHeaders() {
+  const headers = { 'Content-Type': 'application/json' };
+  if (sessionAffinity) {
+    headers['X-Session-Affinity'] = sessionAffinity;
+  }
+  return headers;
+}
+
 // Initialize page
 document.addEventListener('DOMContentLoaded', () => {
   loadSimulators();
@@ -94,12 +108,20 @@ async function startSimulator(simulatorId, simulatorName) {
     const response = await fetch(`${API_BASE}/simulator/${simulatorId}/start`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ session_id: currentSessionId })
+      body: JSON.stringify({
+        session_id: currentSessionId,
+        response_mode: 'binary',
+        frame_format: 'jpeg',
+        render_mode: 'vector'
+      })
     });
     
     if (!response.ok) {
       throw new Error('Failed to start simulator');
     }
+    const started = await response.json();
+    sessionAffinity = started.affinity || null;
+    renderMode = started.render_mode || 'raster';
     
     // Show simulator view and hide selection
     const selection = document.querySelector('.simulator-selection');
@@ -218,34 +240,49 @@ function setupControls(simulatorId) {
 function startAnimationLoop() {
   const canvas = document.getElementById('simulator-canvas');
   const ctx = canvas.getContext('2d');
+  let lastFrameEtag = null;
   
   async function animate() {
     if (!currentSimulator || !currentSessionId) return;
     
     try {
+      const headers = sessionHeaders();
+      if (lastFrameEtag) {
+        headers['If-None-Match'] = lastFrameEtag;
+      }
       const response = await fetch(`${API_BASE}/simulator/${currentSimulator}/update`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers,
         body: JSON.stringify({ 
           session_id: currentSessionId,
           params: getCurrentParams()
         })
       });
       
+      // Frame unchanged since last draw (idle graph)
+      if (response.status === 304) {
+        animationFrameId = requestAnimationFrame(animate);
+        return;
+      }
+      
       if (!response.ok) {
         throw new Error('Failed to update simulator');
       }
       
-      const data = await response.json();
+      lastFrameEtag = response.headers.get('ETag');
       
-      // Load and draw image
-      const img = new Image();
-      img.onload = () => {
+      if (renderMode === 'vector') {
+        // Primitive list, drawn here instead of decoding a server-rendered image
+        drawScene(ctx, (await response.json()).scene);
+      } else {
+        // Binary frame body (session started with response_mode: 'binary')
+        const blob = await response.blob();
+        const bitmap = await createImageBitmap(blob);
         ctx.clearRect(0, 0, canvas.width, canvas.height);
-        ctx.drawImage(img, 0, 0);
-        document.getElementById('canvas-overlay').style.display = 'none';
-      };
-      img.src = data.frame;
+        ctx.drawImage(bitmap, 0, 0);
+        bitmap.close();
+      }
+      document.getElementById('canvas-overlay').style.display = 'none';
       
     } catch (error) {
       console.error('Animation error:', error);
@@ -257,6 +294,79 @@ function startAnimationLoop() {
   animate();
 }
 
+/**
+ * Draw a vector scene (ops as documented on the backend's VectorPainter)
+ */
+function drawScene(ctx, scene) {
+  ctx.save();
+  ctx.lineCap = 'round';
+  ctx.lineJoin = 'round';
+  for (const op of scene.ops) {
+    switch (op[0]) {
+      case 'fill':
+        ctx.fillStyle = op[1];
+        ctx.fillRect(0, 0, scene.width, scene.height);
+        break;
+      case 'line':
+        ctx.strokeStyle = op[5];
+        ctx.lineWidth = op[6];
+        ctx.beginPath();
+        ctx.moveTo(op[1] + 0.5, op[2] + 0.5);
+        ctx.lineTo(op[3] + 0.5, op[4] + 0.5);
+        ctx.stroke();
+        break;
+      case 'rect':
+        if (op[6] < 0) {
+          ctx.fillStyle = op[5];
+          ctx.fillRect(op[1], op[2], op[3] - op[1] + 1, op[4] - op[2] + 1);
+        } else {
+          ctx.strokeStyle = op[5];
+          ctx.lineWidth = op[6];
+          ctx.strokeRect(op[1] + 0.5, op[2] + 0.5, op[3] - op[1], op[4] - op[2]);
+        }
+        break;
+      case 'circle':
+      case 'arc': {
+        const [x, y, r] = [op[1], op[2], op[3]];
+        const isArc = op[0] === 'arc';
+        const start = isArc ? op[4] * Math.PI / 180 : 0;
+        const end = isArc ? op[5] * Math.PI / 180 : 2 * Math.PI;
+        const color = isArc ? op[6] : op[4];
+        const width = isArc ? op[7] : op[5];
+        ctx.beginPath();
+        ctx.arc(x + 0.5, y + 0.5, r, start, end);
+        if (width < 0) {
+          ctx.fillStyle = color;
+          ctx.fill();
+        } else {
+          ctx.strokeStyle = color;
+          ctx.lineWidth = width;
+          ctx.stroke();
+        }
+        break;
+      }
+      case 'poly': {
+        const pts = op[1];
+        ctx.strokeStyle = op[2];
+        ctx.lineWidth = op[3];
+        ctx.beginPath();
+        ctx.moveTo(pts[0] + 0.5, pts[1] + 0.5);
+        for (let i = 2; i < pts.length; i += 2) {
+          ctx.lineTo(pts[i] + 0.5, pts[i + 1] + 0.5);
+        }
+        ctx.stroke();
+        break;
+      }
+      case 'text':
+        ctx.fillStyle = op[5];
+        ctx.font = `${op[6] > 1 ? 'bold ' : ''}${op[4]}px sans-serif`;
+        ctx.fillText(op[3], op[1], op[2]);
+        break;
+    }
+  }
+  ctx.restore();
+}
+
 /**
  * Get current parameters based on simulator type
  */
@@ -327,7 +437,7 @@ async function stopSimulator() {
     try {
       await fetch(`${API_BASE}/simulator/${currentSimulator}/stop`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: sessionHeaders(),
         body: JSON.stringify({ session_id: currentSessionId })
       });
     } catch (error) {
@@ -6,14 +6,35 @@
 const API_BASE = 'http://localhost:5000/api/physics';
 let currentSimulator = null;
 let currentSessionId = null;
+let sessionAffinity = null; // Server process that owns the session (multi-process deployments)
 let animationFrameId = null;
+let frameStream = null; // <img> receiving the server-push MJPEG stream
+let lastSentParams = null; // JSON of the last params pushed while streaming
+let paramsInFlight = false;
+// Simulators where only a small region changes per frame: poll for dirty-tile updates instead of streaming
+const DELTA_SIMULATORS = ['projectile', 'rotational'];
+// Default gesture frame size; the backend's /gesture/config can override it
+const GESTURE_INPUT_SIZE = [256, 192];
 let cameraStream = null;
 let gestureProcessor = null;
 let gestureInterval = null;
+let gestureClientId = null; // Issued by /gesture/config; keys this page's hand tracker on the server
 let isCameraEnabled = false;
 let isManualControl = false; // Flag to prevent gesture updates when user manually controls
 let lastGestureUpdate = {}; // Store last gesture values for smoothing
 
+/**
+ * JSON request headers for session calls, including the affinity key that
+ * routes the request to the server process owning the session
+ */
+function sessionHeaders() {
+  const headers = { 'Content-Type': 'application/json' };
+  if (sessionAffinity) {
+    headers['X-Session-Affinity'] = sessionAffinity;
+  }
+  return headers;
+}
+
 // Initialize page
 document.addEventListener('DOMContentLoaded', () => {
   loadSimulators();
@@ -103,12 +124,17 @@ async function startSimulator(simulatorId, simulatorName) {
     const response = await fetch(`${API_BASE}/simulator/${simulatorId}/start`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ session_id: currentSessionId })
+      body: JSON.stringify({
+        session_id: currentSessionId,
+        response_mode: 'binary',
+        frame_format: 'jpeg'
+      })
     });
     
     if (!response.ok) {
       throw new Error('Failed to start simulator');
     }
+    sessionAffinity = (await response.json()).affinity || null;
     
     // Show simulator view and hide selection
     const selection = document.querySelector('.simulator-selection');
@@ -122,8 +148,13 @@ async function startSimulator(simulatorId, simulatorName) {
     // Setup controls
     setupControls(simulatorId);
     
-    // Start animation loop
-    startAnimationLoop();
+    if (DELTA_SIMULATORS.includes(simulatorId)) {
+      // Poll for changed tiles only
+      startAnimationLoop();
+    } else {
+      // Start server-push frame stream (falls back to polling on error)
+      startFrameStream();
+    }
     
   } catch (error) {
     console.error('Failed to start simulator:', error);
@@ -246,6 +277,14 @@ function setupControls(simulatorId) {
         <label>Amplitude: <span id="amp-value">0.9</span></label>
         <input type="range" id="amp-slider" min="0.1" max="1.5" value="0.9" step="0.1">
       </div>
+      <div class="control-input">
+        <label>Quality:</label>
+        <select id="quality-select" class="control-select">
+          <option value="high">High</option>
+          <option value="medium">Medium</option>
+          <option value="low">Low</option>
+        </select>
+      </div>
       <button class="btn-primary" id="pause-btn">Pause</button>
     `;
     
@@ -315,34 +354,51 @@ function setupControls(simulatorId) {
 function startAnimationLoop() {
   const canvas = document.getElementById('simulator-canvas');
   const ctx = canvas.getContext('2d');
+  const useDelta = DELTA_SIMULATORS.includes(currentSimulator);
+  let frameSeq = null; // Sequence number of the frame currently on the canvas
   
   async function animate() {
     if (!currentSimulator || !currentSessionId) return;
     
     try {
+      const request = {
+        session_id: currentSessionId,
+        params: getCurrentParams()
+      };
+      if (useDelta) {
+        request.delta = true;
+        request.base_seq = frameSeq;
+      }
       const response = await fetch(`${API_BASE}/simulator/${currentSimulator}/update`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ 
-          session_id: currentSessionId,
-          params: getCurrentParams()
-        })
+        headers: sessionHeaders(),
+        body: JSON.stringify(request)
       });
       
       if (!response.ok) {
         throw new Error('Failed to update simulator');
       }
       
-      const data = await response.json();
-      
-      // Load and draw image
-      const img = new Image();
-      img.onload = () => {
+      if (response.headers.get('Content-Type').startsWith('application/json')) {
+        // Dirty-tile update: patch only the changed regions of the current frame
+        const update = await response.json();
+        const bitmaps = await Promise.all(update.tiles.map(async (tile) =>
+          createImageBitmap(await (await fetch(tile.data)).blob())));
+        update.tiles.forEach((tile, i) => {
+          ctx.drawImage(bitmaps[i], tile.x, tile.y);
+          bitmaps[i].close();
+        });
+        frameSeq = update.seq;
+      } else {
+        // Binary frame body (session started with response_mode: 'binary')
+        const blob = await response.blob();
+        const bitmap = await createImageBitmap(blob);
         ctx.clearRect(0, 0, canvas.width, canvas.height);
-        ctx.drawImage(img, 0, 0);
-        document.getElementById('canvas-overlay').style.display = 'none';
-      };
-      img.src = data.frame;
+        ctx.drawImage(bitmap, 0, 0);
+        bitmap.close();
+        frameSeq = Number(response.headers.get('X-Frame-Seq')) || null;
+      }
+      document.getElementById('canvas-overlay').style.display = 'none';
       
     } catch (error) {
       console.error('Animation error:', error);
@@ -354,6 +410,78 @@ function startAnimationLoop() {
   animate();
 }
 
+/**
+ * Start server-push frame stream (multipart MJPEG) and send params only when they change
+ */
+function startFrameStream() {
+  const canvas = document.getElementById('simulator-canvas');
+  const ctx = canvas.getContext('2d');
+  
+  lastSentParams = null;
+  frameStream = new Image();
+  frameStream.onerror = () => {
+    console.warn('Frame stream unavailable, falling back to polling');
+    stopFrameStream();
+    startAnimationLoop();
+  };
+  let url = `${API_BASE}/simulator/${currentSimulator}/stream?session_id=${encodeURIComponent(currentSessionId)}`;
+  if (sessionAffinity) {
+    url += `&affinity=${encodeURIComponent(sessionAffinity)}`;
+  }
+  frameStream.src = url;
+  
+  function draw() {
+    if (!frameStream || !currentSimulator || !currentSessionId) return;
+    
+    if (frameStream.naturalWidth > 0) {
+      ctx.drawImage(frameStream, 0, 0);
+      document.getElementById('canvas-overlay').style.display = 'none';
+    }
+    pushParamsIfChanged();
+    
+    animationFrameId = requestAnimationFrame(draw);
+  }
+  
+  draw();
+}
+
+/**
+ * Stop the frame stream (closes the server connection)
+ */
+function stopFrameStream() {
+  if (animationFrameId) {
+    cancelAnimationFrame(animationFrameId);
+    animationFrameId = null;
+  }
+  if (frameStream) {
+    frameStream.onerror = null;
+    frameStream.src = '';
+    frameStream = null;
+  }
+}
+
+/**
+ * Send current parameters to the lightweight params endpoint if they changed
+ */
+async function pushParamsIfChanged() {
+  const params = JSON.stringify(getCurrentParams());
+  if (paramsInFlight || params === lastSentParams) return;
+  
+  paramsInFlight = true;
+  try {
+    await fetch(`${API_BASE}/simulator/${currentSimulator}/params`, {
+      method: 'POST',
+      headers: sessionHeaders(),
+      body: JSON.stringify({ session_id: currentSessionId, params: JSON.parse(params) })
+    });
+    lastSentParams = params;
+  } catch (error) {
+    console.error('Failed to send params:', error);
+  } finally {
+    paramsInFlight = false;
+  }
+}
+
 /**
  * Get current parameters based on simulator type
  */
@@ -372,7 +500,8 @@ function getCurrentParams() {
     return {
       freq: parseFloat(document.getElementById('freq-slider')?.value || 1.2),
       amp: parseFloat(document.getElementById('amp-slider')?.value || 0.9),
-      paused: document.getElementById('pause-btn')?.textContent === 'Resume'
+      paused: document.getElementById('pause-btn')?.textContent === 'Resume',
+      quality_mode: document.getElementById('quality-select')?.value || 'high'
     };
   } else if (currentSimulator === 'rotational') {
     return {
@@ -388,9 +517,9 @@ function getCurrentParams() {
  */
 async function launchProjectile(velocity, angle) {
   try {
-    await fetch(`${API_BASE}/simulator/projectile/update`, {
+    await fetch(`${API_BASE}/simulator/projectile/params`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: sessionHeaders(),
       body: JSON.stringify({
         session_id: currentSessionId,
         params: {
@@ -429,10 +558,7 @@ function updateRotational() {
  * Stop current simulator
  */
 async function stopSimulator() {
-  if (animationFrameId) {
-    cancelAnimationFrame(animationFrameId);
-    animationFrameId = null;
-  }
+  stopFrameStream();
   
   // Disable camera if enabled
   if (isCameraEnabled) {
@@ -447,7 +573,7 @@ async function stopSimulator() {
     try {
       await fetch(`${API_BASE}/simulator/${currentSimulator}/stop`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: sessionHeaders(),
         body: JSON.stringify({ session_id: currentSessionId })
       });
     } catch (error) {
@@ -632,10 +758,22 @@ function startGestureProcessing(video) {
     return;
   }
   
+  // Frames go out at the small size the backend asks for, so it never has to resize
   const canvas = document.createElement('canvas');
   const ctx = canvas.getContext('2d');
-  canvas.width = 640;
-  canvas.height = 480;
+  canvas.width = GESTURE_INPUT_SIZE[0];
+  canvas.height = GESTURE_INPUT_SIZE[1];
+  fetch(`${API_BASE}/gesture/config`)
+    .then(response => response.ok ? response.json() : null)
+    .then(config => {
+      if (config && config.input_size) {
+        [canvas.width, canvas.height] = config.input_size;
+      }
+      if (config && config.client_id) {
+        gestureClientId = config.client_id;
+      }
+    })
+    .catch(() => {});
   
   let frameCount = 0;
   
@@ -648,11 +786,8 @@ function startGestureProcessing(video) {
       // Draw video frame to canvas
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
       
-      // Get image data for processing
-      const imageData = ctx.getImageData(0, 0, canvas.width, canvas.height);
-      
       // Process gesture frame
-      const gestureData = await processGestureFrame(imageData);
+      const gestureData = await processGestureFrame(canvas);
       
       // Debug: Log gesture data periodically
       if (gestureData && frameCount % 30 === 0) { // Log every 3 seconds
@@ -664,15 +799,17 @@ function startGestureProcessing(video) {
         });
       }
       
-      // Display annotated frame with landmarks if available
-      if (gestureData && gestureData.annotated_frame) {
+      // Draw landmarks over the live preview
+      if (gestureData && gestureData.hands && gestureData.hands.length) {
         const preview = document.getElementById('camera-preview');
         if (preview) {
-          // Create an overlay image element to show annotated frame
+          // Transparent canvas overlay on top of the preview video
           let overlay = document.getElementById('camera-annotated-overlay');
           if (!overlay) {
-            overlay = document.createElement('img');
+            overlay = document.createElement('canvas');
             overlay.id = 'camera-annotated-overlay';
+            overlay.width = canvas.width;
+            overlay.height = canvas.height;
             overlay.style.cssText = 'position: absolute; top: 0; left: 0; width: 100%; height: 100%; object-fit: contain; pointer-events: none; transform: scaleX(-1); z-index: 2;';
             const previewContainer = preview.parentElement;
             if (previewContainer) {
@@ -680,7 +817,7 @@ function startGestureProcessing(video) {
               previewContainer.appendChild(overlay);
             }
           }
-          overlay.src = gestureData.annotated_frame;
+          drawHandLandmarks(overlay, gestureData.hands);
           overlay.style.display = 'block';
         }
       } else {
@@ -727,30 +864,82 @@ function startGestureProcessing(video) {
   }, 100); // Process every 100ms
 }
 
+// MediaPipe hand landmark connections (same as mp.solutions.hands.HAND_CONNECTIONS)
+const HAND_CONNECTIONS = [
+  [0, 1], [1, 2], [2, 3], [3, 4], [0, 5], [5, 6], [6, 7], [7, 8],
+  [5, 9], [9, 10], [10, 11], [11, 12], [9, 13], [13, 14], [14, 15], [15, 16],
+  [13, 17], [0, 17], [17, 18], [18, 19], [19, 20]
+];
+
+/**
+ * Draw hand landmarks (normalized [x0, y0, x1, y1, ...] per hand) onto an overlay canvas
+ */
+function drawHandLandmarks(overlay, hands) {
+  const ctx = overlay.getContext('2d');
+  const w = overlay.width;
+  const h = overlay.height;
+  ctx.clearRect(0, 0, w, h);
+  
+  for (const hand of hands) {
+    const pts = hand.landmarks;
+    const px = (i) => [pts[2 * i] * w, pts[2 * i + 1] * h];
+    
+    // Connections
+    ctx.strokeStyle = 'rgb(0, 0, 255)';
+    ctx.lineWidth = 2;
+    ctx.beginPath();
+    for (const [a, b] of HAND_CONNECTIONS) {
+      ctx.moveTo(...px(a));
+      ctx.lineTo(...px(b));
+    }
+    ctx.stroke();
+    
+    // Landmarks
+    ctx.fillStyle = 'rgb(0, 255, 0)';
+    for (let i = 0; i < pts.length / 2; i++) {
+      const [x, y] = px(i);
+      ctx.beginPath();
+      ctx.arc(x, y, 3, 0, 2 * Math.PI);
+      ctx.fill();
+    }
+    
+    // Thumb-index pinch line
+    const [x1, y1] = px(4);
+    const [x2, y2] = px(8);
+    ctx.strokeStyle = 'rgb(0, 200, 200)';
+    ctx.beginPath();
+    ctx.moveTo(x1, y1);
+    ctx.lineTo(x2, y2);
+    ctx.stroke();
+    ctx.fillStyle = 'rgb(0, 180, 255)';
+    ctx.beginPath();
+    ctx.arc((x1 + x2) / 2, (y1 + y2) / 2, 6, 0, 2 * Math.PI);
+    ctx.fill();
+  }
+}
+
 /**
  * Process gesture frame (sends to backend for processing)
  */
-async function processGestureFrame(imageData) {
+async function processGestureFrame(canvas) {
   try {
-    // Convert imageData to base64
-    const canvas = document.createElement('canvas');
-    canvas.width = imageData.width;
-    canvas.height = imageData.height;
-    const ctx = canvas.getContext('2d');
-    ctx.putImageData(imageData, 0, 0);
-    
-    const dataUrl = canvas.toDataURL('image/jpeg', 0.5);
-    const base64 = dataUrl.split(',')[1];
-    
-    // Send to backend for gesture processing
-    const response = await fetch(`${API_BASE}/gesture/process`, {
+    // The server needs a client id to keep this page's tracker apart from others
+    if (!gestureClientId) {
+      return null;
+    }
+    
+    // Raw JPEG body instead of base64 JSON
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.7));
+    if (!blob) {
+      return null;
+    }
+    
+    // Send to backend for gesture processing (landmarks only; the overlay is drawn here).
+    const query = new URLSearchParams({ session_id: gestureClientId, return_annotated: 'false' });
+    const response = await fetch(`${API_BASE}/gesture/process?${query}`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        image: base64,
-        width: imageData.width,
-        height: imageData.height
-      })
+      headers: { 'Content-Type': 'image/jpeg' },
+      body: blob
     });
     
     if (response.ok) {
@@ -11,6 +11,7 @@ C = 1.0
 DECAY = 0.08
 COLORMAP = cv2.COLORMAP_TURBO
 FPS_TARGET = 30.0
+DOWNSAMPLE = 1          # compute the field every N pixels and upsample (1, 2 or 4)
 
 # gesture mapping
 FREQ_MIN, FREQ_MAX = 0.2, 6.0
@@ -42,10 +43,11 @@ def smooth(prev,new,alpha=0.25): return new if prev is None else prev*(1-alpha)+
 
 # ----------------- Wave simulator class ----------------
 class WaveSimulator:
-    def __init__(self, w=SIM_W, h=SIM_H, c=C, decay=DECAY, colormap=COLORMAP):
+    def __init__(self, w=SIM_W, h=SIM_H, c=C, decay=DECAY, colormap=COLORMAP, downsample=DOWNSAMPLE):
         self.width = int(w); self.height = int(h)
         self.c = float(c); self.decay = float(decay)
         self.colormap = colormap
+        self.downsample = max(1, int(downsample))
 
         # two sources initial positions and params
         self.sources = [
@@ -87,15 +89,21 @@ class WaveSimulator:
         if not self.paused:
             self.t += dt
 
+    def cycle_downsample(self):
+        self.downsample = {1: 2, 2: 4}.get(self.downsample, 1)
+
     def compute_field(self):
         H,W = self.height, self.width
-        field = np.zeros((H,W), dtype=np.float32)
+        # sample every f-th pixel (offset toward block centre), upsample afterwards
+        f = self.downsample; o = (f-1)//2
+        gx = self.grid_x[o::f, o::f]; gy = self.grid_y[o::f, o::f]
+        field = np.zeros(gx.shape, dtype=np.float32)
         active = [self.sources[0]]
         if self.two_source: active.append(self.sources[1])
         for s in active:
             sx, sy = s['pos']
-            rx = (self.grid_x - sx).astype(np.float32)
-            ry = (self.grid_y - sy).astype(np.float32)
+            rx = (gx - sx).astype(np.float32)
+            ry = (gy - sy).astype(np.float32)
             r = np.hypot(rx, ry) + 1e-6
             omega = 2.0*math.pi*float(s['freq'])
             phase = float(s.get('phase',0.0))
@@ -103,6 +111,8 @@ class WaveSimulator:
             att = 1.0 / (1.0 + r*self.decay)
             contrib = float(s['amp']) * att * np.sin(arg)
             field += contrib.astype(np.float32)
+        if f > 1:
+            field = cv2.resize(field, (W,H), interpolation=cv2.INTER_LINEAR)
         return field
 
     def render_field(self, field):
@@ -322,7 +332,7 @@ def main():
             # overlay help text on camera
             cv2.putText(frame, "Left hand: frequency | Right hand: amplitude | Pinch: pause", (10, cam_h-70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,0),1)
             cv2.putText(frame, "Click simulator window to move sources. Buttons: Single/Two/Play", (10, cam_h-50), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (200,200,200),1)
-            cv2.putText(frame, "Keys: s(single) d(two) c(reset) q(quit)", (10, cam_h-30), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (200,200,200),1)
+            cv2.putText(frame, f"Keys: s(single) d(two) c(reset) r(resolution 1/{sim.downsample}) q(quit)", (10, cam_h-30), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (200,200,200),1)
 
             # show windows
             cv2.imshow("Gesture Camera", frame)
@@ -333,6 +343,7 @@ def main():
             if key == ord('s'): sim.two_source=False
             if key == ord('d'): sim.two_source=True
             if key == ord('c'): sim.reset()
+            if key == ord('r'): sim.cycle_downsample()
 
     except KeyboardInterrupt:
         pass